@@ -8,18 +8,61 @@ load_dotenv()
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Connection pools: persistent connections and extra ones allowed under load
+# of the async engine (the read API) and of the sync engine (refreshes, the
+# notification outbox and startup), then seconds to wait for a free
+# connection, seconds before one is replaced, and whether to check them
+# before use. Each worker opens at most DB_POOL_SIZE + DB_MAX_OVERFLOW +
+# SYNC_DB_POOL_SIZE + SYNC_DB_MAX_OVERFLOW + 1 connections (the last one
+# listens for changes), 26 by default: keep that times the number of workers
+# below Postgres's max_connections (100 by default), leaving room for other
+# clients.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+SYNC_DB_POOL_SIZE = int(os.getenv("SYNC_DB_POOL_SIZE", "2"))
+SYNC_DB_MAX_OVERFLOW = int(os.getenv("SYNC_DB_MAX_OVERFLOW", "3"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
 # Telegram
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Rows per INSERT ... ON CONFLICT statement when syncing listings
+SYNC_BATCH_SIZE = 1000
 
 # Notification settings
 NOTIFICATION_MAX_PRICE = 700
 
+# Telegram limits: messages per second to one chat (20/min for groups and
+# channels) and overall, and retries after 429/5xx responses
+TELEGRAM_CHAT_RATE = 20 / 60
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_MAX_RETRIES = 3
+
+# Characters per Telegram message
+TELEGRAM_MESSAGE_MAX_LENGTH = 4096
+
+# Listings per notification message (1 sends one message per listing), as
+# many as fit in TELEGRAM_MESSAGE_MAX_LENGTH
+TELEGRAM_DIGEST_SIZE = int(os.getenv("TELEGRAM_DIGEST_SIZE", "1"))
+
+# Notification outbox: seconds between checks for pending notifications when
+# not woken by a sync, delivery attempts before giving up on one, and seconds
+# a worker holds claimed notifications before others may retry them (longer
+# than a send with its rate limit waits and retries)
+TELEGRAM_OUTBOX_POLL = 60.0
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = 5
+TELEGRAM_OUTBOX_LEASE = 300.0
+
 # Base coordinates
 BASE_LAT = 42.2313601
 BASE_LON = -8.7124252
 
-# Search parameters
+# Search parameters (the API URL can point to a stand-in, see benchmarks)
+WALLAPOP_API_URL = os.getenv("WALLAPOP_API_URL", "https://api.wallapop.com")
 BASE_PARAMS = {
     "category_id": "200",
     "distance_in_km": "40",
@@ -35,6 +78,52 @@ BASE_PARAMS = {
 PROPERTY_TYPES = ["apartment", "house"]
 MIN_PRICE = 300
 
+# Scraper concurrency: max searches (property type x price band) in flight
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "4"))
+
+# Scraper politeness: max requests per second (adapted down on 429s) and
+# retries with exponential backoff for 429/5xx and network errors
+SCRAPER_RATE = float(os.getenv("SCRAPER_RATE", "2"))
+SCRAPER_MAX_RETRIES = int(os.getenv("SCRAPER_MAX_RETRIES", "4"))
+SCRAPER_BACKOFF_BASE = 1.0
+SCRAPER_BACKOFF_MAX = 30.0
+
+# Incremental refreshes search newest first and stop at the first page with
+# nothing new or changed; a full sweep (which also detects removals) runs when
+# the last one is older than FULL_SWEEP_INTERVAL seconds
+INCREMENTAL_ORDER_BY = "newest"
+FULL_SWEEP_INTERVAL = int(os.getenv("FULL_SWEEP_INTERVAL", str(6 * 3600)))
+
+# Built-in refresh scheduler: seconds between refreshes of each property type
+# (REFRESH_INTERVAL_<TYPE> overrides REFRESH_INTERVAL) with random jitter as a
+# fraction of the interval (REFRESH_JITTER_<TYPE> overrides REFRESH_JITTER)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+REFRESH_INTERVALS = {
+    property_type: int(
+        os.getenv(
+            f"REFRESH_INTERVAL_{property_type.upper()}",
+            os.getenv("REFRESH_INTERVAL", "1800"),
+        )
+    )
+    for property_type in PROPERTY_TYPES
+}
+REFRESH_JITTERS = {
+    property_type: float(
+        os.getenv(
+            f"REFRESH_JITTER_{property_type.upper()}",
+            os.getenv("REFRESH_JITTER", "0.1"),
+        )
+    )
+    for property_type in PROPERTY_TYPES
+}
+
+# Postgres advisory lock id held while refreshing, so only one worker refreshes
+REFRESH_LOCK_KEY = 4_712_001
+
+# Price bands (min, max) searched separately for each property type, each with
+# its own page budget. Empty to search the whole price range at once.
+PRICE_SHARDS: list[tuple[int, int | None]] = []
+
 TEMPORARY_RENTAL_KEYWORDS = [
     "vacacional",
     "vacaciones",
@@ -62,6 +151,28 @@ TEMPORARY_RENTAL_KEYWORDS = [
 
 ]
 
+# Cache
+LISTINGS_CACHE_SIZE = int(os.getenv("LISTINGS_CACHE_SIZE", "256"))
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", "50000"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
 # Paths
 DATA_DIR = Path(__file__).parent.parent
 STATICS_DIR = DATA_DIR / "statics"
+
+# Image proxy: listing thumbnails resized to IMAGE_THUMB_WIDTH pixels and kept
+# on disk in an LRU cache of at most IMAGE_CACHE_MAX_MB, fetched only from the
+# hosts of IMAGE_PROXY_HOSTS (and their subdomains) and only if the source
+# image is at most IMAGE_SOURCE_MAX_MB
+IMAGE_CACHE_DIR = Path(
+    os.getenv("IMAGE_CACHE_DIR", str(DATA_DIR / "cache" / "images"))
+)
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "512"))
+IMAGE_THUMB_WIDTH = int(os.getenv("IMAGE_THUMB_WIDTH", "400"))
+IMAGE_THUMB_QUALITY = 75
+IMAGE_SOURCE_MAX_MB = int(os.getenv("IMAGE_SOURCE_MAX_MB", "10"))
+IMAGE_PROXY_HOSTS = tuple(
+    host.strip()
+    for host in os.getenv("IMAGE_PROXY_HOSTS", "wallapop.com").split(",")
+    if host.strip()
+)
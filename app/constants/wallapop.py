@@ -1,5 +1,9 @@
 """Wallapop API headers and constants"""
 
+from app.config import WALLAPOP_API_URL
+
+SEARCH_URL = f"{WALLAPOP_API_URL}/api/v3/search"
+
 HEADERS = {
     "Accept": "application/json, text/plain, */*",
     "Connection": "keep-alive",
@@ -1,7 +1,18 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SYNC_DB_MAX_OVERFLOW,
+    SYNC_DB_POOL_SIZE,
+)
 
 # Use psycopg3 driver (psycopg)
 db_url = (
@@ -9,17 +20,115 @@ db_url = (
     if DATABASE_URL
     else None
 )
-engine = create_engine(db_url) if db_url else None
+pool_options = {
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+# Sync engine for refreshes, the notification outbox and startup (few
+# connections: one per property type being synced, plus a handful)
+engine = (
+    create_engine(
+        db_url,
+        pool_size=SYNC_DB_POOL_SIZE,
+        max_overflow=SYNC_DB_MAX_OVERFLOW,
+        **pool_options,
+    )
+    if db_url
+    else None
+)
 SessionLocal = sessionmaker(bind=engine)
+
+# Async engine (psycopg3 async) for the read API
+async_engine = (
+    create_async_engine(
+        db_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        **pool_options,
+    )
+    if db_url
+    else None
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
 Base = declarative_base()
 
+# Idempotent schema changes for tables created by earlier versions
+MIGRATIONS = [
+    "ALTER TABLE listings ADD COLUMN IF NOT EXISTS distance_km DOUBLE PRECISION",
+    "ALTER TABLE listings ADD COLUMN IF NOT EXISTS geo_cell BIGINT",
+    "ALTER TABLE listings ADD COLUMN IF NOT EXISTS image_sizes JSONB",
+    # Hashes became 64-bit integers, recomputed by backfill_hashes
+    """
+    DO $$ BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'listings' AND column_name = 'hash') <> 'bigint'
+        THEN
+            ALTER TABLE listings ALTER COLUMN hash TYPE BIGINT USING 0;
+        END IF;
+    END $$
+    """,
+]
+
 
 def init_db():
-    """Create tables if they don't exist"""
-    from app.models.listing import Listing  # noqa: F401
+    """Create tables if they don't exist and apply pending migrations"""
+    from app.config import BASE_LAT, BASE_LON
+    from app.models.data_version import DataVersion
+    from app.models.history import ListingHistory  # noqa: F401
+    from app.models.listing import Listing
+    from app.models.listing_search import ListingSearch  # noqa: F401
+    from app.models.outbox import OutboxNotification  # noqa: F401
+    from app.models.refresh import RefreshState  # noqa: F401
+    from app.services.geo import grid_cell_sql, haversine_sql
+    from app.services.history import backfill_history, seed_history
+    from app.services.projection import refresh_stale_projection
+    from app.services.sync import backfill_hashes
 
     Base.metadata.create_all(bind=engine)
 
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+
+        # Indexes added after a table was created are not handled by create_all
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+        # The shared data version is a single row
+        conn.execute(
+            insert(DataVersion).values(id=1, version=0).on_conflict_do_nothing()
+        )
+
+        # Backfill location columns for rows stored before they existed
+        conn.execute(
+            Listing.__table__.update()
+            .where(
+                Listing.geo_cell.is_(None),
+                Listing.latitude.isnot(None),
+                Listing.longitude.isnot(None),
+            )
+            .values(
+                distance_km=haversine_sql(
+                    BASE_LAT, BASE_LON, Listing.latitude, Listing.longitude
+                ),
+                geo_cell=grid_cell_sql(Listing.latitude, Listing.longitude),
+            )
+        )
+
+    db = SessionLocal()
+    try:
+        backfill_hashes(db)
+        seed_history(db)
+        backfill_history(db)
+        db.commit()
+        refresh_stale_projection(db)
+    finally:
+        db.close()
+
 
 def get_db():
     """Get database session"""
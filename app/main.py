@@ -1,19 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from brotli_asgi import BrotliMiddleware
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
-from app.config import STATICS_DIR
-from app.routers import health, listings, scraper
+from app.config import SCHEDULER_ENABLED, STATICS_DIR
+from app.db import async_engine, engine, init_db
+from app.middleware import ConditionalCacheMiddleware, MetricsMiddleware
+from app.routers import health, images, listings, metrics, scraper
+from app.services.changes import listen_for_changes
+from app.services.images import close_client
+from app.services.scheduler import run_scheduler
+from app.services.telegram import dispatcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    # Apply schema changes before serving reads
+    if engine is not None:
+        init_db()
+        # Deliver notifications left pending by a previous run
+        dispatcher.start()
+        # Drop cached data when another worker syncs
+        tasks.append(asyncio.create_task(listen_for_changes()))
+        if SCHEDULER_ENABLED:
+            tasks.append(asyncio.create_task(run_scheduler()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    dispatcher.stop()
+    await close_client()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+app = FastAPI(title="BuscaPisos", lifespan=lifespan)
+
+# Brotli compression (quality 6), except for already compressed images
+app.add_middleware(
+    BrotliMiddleware, quality=6, minimum_size=500, excluded_handlers=["^/api/images/"]
+)
 
-app = FastAPI(title="BuscaPisos")
+# ETags, 304s and cached compressed bodies for listings, stats and static
+# files (added last so it runs before Brotli compression)
+app.add_middleware(ConditionalCacheMiddleware, statics_dir=STATICS_DIR)
 
-# Brotli compression (quality 6)
-app.add_middleware(BrotliMiddleware, quality=6, minimum_size=500)
+# Request latency metrics (outermost, so cached responses are measured too)
+app.add_middleware(MetricsMiddleware)
 
 # Routers
 app.include_router(health.router)
+app.include_router(images.router)
 app.include_router(listings.router)
+app.include_router(metrics.router)
 app.include_router(scraper.router)
 
 # Serve static files
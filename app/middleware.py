@@ -0,0 +1,235 @@
+"""
+Conditional GET and compressed response caching, and request metrics.
+
+Listings and stats responses get a strong ETag derived from the data version
+(shared by all workers) and the query parameters, so unchanged polls are
+answered with 304 and changed ones reuse already compressed bodies until
+the next sync. Only 200 responses are cached: failed reads are 503s. Static
+files are compressed once at startup at the highest quality.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+import brotli
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.services.cache import get_data_tag, get_response, put_response
+from app.services.metrics import HTTP_REQUEST_SECONDS
+
+CACHED_PATHS = {"/api/listings", "/api/stats"}
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Preferred encoding accepted by the client: br, gzip or identity"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def compress(body: bytes, encoding: str, quality: int = 6) -> bytes:
+    """Compress a body with br or gzip at a 0-11 quality level"""
+    if encoding == "br":
+        return brotli.compress(body, quality=quality)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=min(9, max(1, quality)))
+    return body
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class StaticAsset:
+    """A static file with its ETag and precompressed bodies"""
+
+    def __init__(self, path: Path):
+        body = path.read_bytes()
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self.media_type = (
+            mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        )
+        self.bodies = {
+            "identity": body,
+            "br": compress(body, "br", quality=11),
+            "gzip": compress(body, "gzip", quality=9),
+        }
+
+
+class ConditionalCacheMiddleware:
+    def __init__(self, app: ASGIApp, statics_dir: Path, index: str = "index.html"):
+        self.app = app
+        self.statics = {
+            f"/static/{path.relative_to(statics_dir).as_posix()}": StaticAsset(path)
+            for path in statics_dir.rglob("*")
+            if path.is_file()
+        }
+        self.statics["/"] = self.statics[f"/static/{index}"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if path in self.statics:
+            await self.send_static(self.statics[path], scope, receive, send)
+        elif path in CACHED_PATHS and scope["method"] == "GET":
+            await self.send_cached(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def send_static(
+        self, asset: StaticAsset, scope: Scope, receive: Receive, send: Send
+    ):
+        headers = Headers(scope=scope)
+        if etag_matches(headers.get("if-none-match", ""), asset.etag):
+            response = Response(status_code=304, headers={"ETag": asset.etag})
+        else:
+            encoding = choose_encoding(headers.get("accept-encoding", ""))
+            response = Response(
+                asset.bodies[encoding],
+                media_type=asset.media_type,
+                headers=self.headers(asset.etag, encoding),
+            )
+        await response(scope, receive, send)
+
+    async def send_cached(self, scope: Scope, receive: Receive, send: Send):
+        headers = Headers(scope=scope)
+        etag = self.etag(scope)
+
+        if etag_matches(headers.get("if-none-match", ""), etag):
+            response = Response(status_code=304, headers=self.headers(etag))
+            await response(scope, receive, send)
+            return
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        cached = get_response((etag, encoding))
+        if cached is None:
+            status, media_type, body = await self.call_uncompressed(
+                scope, receive
+            )
+            if status != 200:
+                await Response(body, status, media_type=media_type)(
+                    scope, receive, send
+                )
+                return
+            cached = (media_type, compress(body, encoding))
+            # Don't cache data read while a sync changed it
+            if self.etag(scope) == etag:
+                put_response((etag, encoding), cached)
+
+        media_type, body = cached
+        response = Response(
+            body, media_type=media_type, headers=self.headers(etag, encoding)
+        )
+        await response(scope, receive, send)
+
+    async def call_uncompressed(
+        self, scope: Scope, receive: Receive
+    ) -> tuple[int, str, bytes]:
+        """Run the app without compression, returning (status, media type, body)"""
+        scope = {
+            **scope,
+            "headers": [
+                (name, value)
+                for name, value in scope["headers"]
+                if name != b"accept-encoding"
+            ],
+        }
+        status = 500
+        media_type = "application/json"
+        chunks = []
+
+        async def collect(message):
+            nonlocal status, media_type
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                media_type = Headers(raw=message["headers"]).get(
+                    "content-type", media_type
+                )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, collect)
+        return status, media_type, b"".join(chunks)
+
+    @staticmethod
+    def etag(scope: Scope) -> str:
+        """Strong ETag from the data version, path and sorted query parameters"""
+        query = sorted(
+            parse_qsl(scope["query_string"].decode(), keep_blank_values=True)
+        )
+        key = f"{scope['path']}?{query}".encode()
+        return f'"{get_data_tag()}-{hashlib.sha1(key).hexdigest()[:16]}"'
+
+    @staticmethod
+    def headers(etag: str, encoding: str = "identity") -> dict:
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return headers
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of each HTTP request by method, route template and
+    status (including responses answered from the caches above).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"], route=self.route(scope), status=status
+            ).observe(time.perf_counter() - start)
+
+    @staticmethod
+    def route(scope: Scope) -> str:
+        """Route template of a request, keeping label values few"""
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        path = scope["path"]
+        if path in CACHED_PATHS or path == "/":
+            return path
+        if path.startswith("/static/"):
+            return "/static"
+        return "unmatched"
@@ -0,0 +1,16 @@
+from sqlalchemy import BigInteger, Column, Integer
+
+from app.db import Base
+
+
+class DataVersion(Base):
+    """
+    Version of the listings data, shared by all workers: a single row whose
+    counter every sync that changes listings bumps in its transaction, so
+    workers tag cached responses alike (see services/changes.py).
+    """
+
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True, default=1)
+    version = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, Index, String
+
+from app.db import Base
+from app.models.listing import Listing
+
+
+class ListingHistory(Base):
+    """
+    Append-only history of listing observations: a row is added whenever a
+    listing is new or its content changed. Rows are kept after the listing
+    is removed, with the attributes trends group by, so trends don't depend
+    on which listings are still online.
+    """
+
+    __tablename__ = "listing_history"
+
+    web_slug = Column(String, primary_key=True)
+    observed_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    price = Column(Float)
+    reserved = Column(Boolean)
+    property_type = Column(Listing.property_type.type)
+    city = Column(String)
+    surface = Column(Float)
+    hash = Column(BigInteger, nullable=False)
+
+
+# Rows arrive in time order, so a BRIN index stays tiny
+Index(
+    "ix_listing_history_observed_at",
+    ListingHistory.observed_at,
+    postgresql_using="brin",
+)
@@ -1,9 +1,10 @@
 import enum
 import hashlib
-import json
 from datetime import datetime
 
+import orjson
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     DateTime,
@@ -13,9 +14,38 @@ from sqlalchemy import (
     String,
     Text,
 )
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 
+from app.config import BASE_LAT, BASE_LON
 from app.db import Base
+from app.services.geo import grid_cell, haversine_distance
+
+
+# Persisted fields that define a listing's content (distance_km and geo_cell
+# derive from the location)
+HASHED_FIELDS = (
+    "web_slug",
+    "property_type",
+    "title",
+    "description",
+    "price",
+    "images",
+    "image_sizes",
+    "reserved",
+    "latitude",
+    "longitude",
+    "postal_code",
+    "city",
+    "region",
+    "country_code",
+    "operation",
+    "surface",
+    "rooms",
+    "bathrooms",
+    "created_at",
+    "modified_at",
+)
+FLOAT_FIELDS = {"price", "latitude", "longitude", "surface"}
 
 
 class PropertyType(enum.Enum):
@@ -28,7 +58,7 @@ class Listing(Base):
 
     web_slug = Column(String, primary_key=True)
     property_type = Column(Enum(PropertyType), nullable=False)
-    hash = Column(String(64), nullable=False)
+    hash = Column(BigInteger, nullable=False)
 
     # Basic data
     title = Column(String)
@@ -37,6 +67,8 @@ class Listing(Base):
 
     # Images
     images = Column(ARRAY(String))
+    # URLs of the other sizes of each image ({"small": ..., "medium": ...})
+    image_sizes = Column(JSONB)
 
     # Status
     reserved = Column(Boolean, default=False)
@@ -48,6 +80,8 @@ class Listing(Base):
     city = Column(String)
     region = Column(String)
     country_code = Column(String(2))
+    distance_km = Column(Float)
+    geo_cell = Column(BigInteger)
 
     # Attributes
     operation = Column(String)
@@ -60,14 +94,32 @@ class Listing(Base):
     modified_at = Column(DateTime)
 
     @staticmethod
-    def compute_hash(item: dict) -> str:
-        """Compute SHA256 hash of item to detect changes"""
-        serialized = json.dumps(item, sort_keys=True, default=str)
-        return hashlib.sha256(serialized.encode()).hexdigest()
+    def compute_hash(row: dict) -> int:
+        """
+        64-bit hash of the persisted fields of a row to detect changes.
+        Numbers are normalized as stored and keys sorted (JSONB reorders
+        them), so rows read back from the database hash the same as the rows
+        they were saved from.
+        """
+        values = [
+            float(row[field])
+            if field in FLOAT_FIELDS and row[field] is not None
+            else row[field]
+            for field in HASHED_FIELDS
+        ]
+        digest = hashlib.blake2b(
+            orjson.dumps(values, option=orjson.OPT_SORT_KEYS), digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big", signed=True)
 
     @classmethod
     def from_dict(cls, item: dict, property_type: str) -> "Listing":
         """Create a Listing from a dictionary"""
+        return cls(**cls.row_from_dict(item, property_type))
+
+    @classmethod
+    def row_from_dict(cls, item: dict, property_type: str) -> dict:
+        """Column values of a Listing from a dictionary"""
         location = item.get("location", {})
         type_attrs = item.get("type_attributes", {})
         reserved = item.get("reserved", {})
@@ -85,25 +137,40 @@ class Listing(Base):
             except (ValueError, TypeError):
                 pass
 
-        return cls(
-            web_slug=item.get("web_slug"),
-            property_type=PropertyType(property_type),
-            hash=cls.compute_hash(item),
-            title=item.get("title"),
-            description=item.get("description"),
-            price=item.get("price"),
-            images=item.get("images", []),
-            reserved=reserved.get("flag", False),
-            latitude=location.get("latitude"),
-            longitude=location.get("longitude"),
-            postal_code=location.get("postal_code"),
-            city=location.get("city"),
-            region=location.get("region"),
-            country_code=location.get("country_code"),
-            operation=type_attrs.get("operation"),
-            surface=type_attrs.get("surface"),
-            rooms=type_attrs.get("rooms"),
-            bathrooms=type_attrs.get("bathrooms"),
-            created_at=created_at,
-            modified_at=modified_at,
-        )
+        latitude = location.get("latitude")
+        longitude = location.get("longitude")
+        distance_km = None
+        geo_cell = None
+        if latitude and longitude:
+            distance_km = round(
+                haversine_distance(BASE_LAT, BASE_LON, latitude, longitude), 1
+            )
+            geo_cell = grid_cell(latitude, longitude)
+
+        row = {
+            "web_slug": item.get("web_slug"),
+            "property_type": PropertyType(property_type),
+            "title": item.get("title"),
+            "description": item.get("description"),
+            "price": item.get("price"),
+            "images": item.get("images", []),
+            "image_sizes": item.get("image_sizes", []),
+            "reserved": reserved.get("flag", False),
+            "latitude": latitude,
+            "longitude": longitude,
+            "postal_code": location.get("postal_code"),
+            "city": location.get("city"),
+            "region": location.get("region"),
+            "country_code": location.get("country_code"),
+            "distance_km": distance_km,
+            "geo_cell": geo_cell,
+            "operation": type_attrs.get("operation"),
+            "surface": type_attrs.get("surface"),
+            "rooms": type_attrs.get("rooms"),
+            "bathrooms": type_attrs.get("bathrooms"),
+            "created_at": created_at,
+            "modified_at": modified_at,
+        }
+        row["hash"] = cls.compute_hash(row)
+        return row
+
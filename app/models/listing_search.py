@@ -0,0 +1,86 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    func,
+    literal_column,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from app.db import Base
+from app.models.listing import Listing
+
+
+class ListingSearch(Base):
+    """
+    Read-optimized projection of listings, refreshed on every sync.
+    Filter and sort columns are flattened and precomputed, and payload holds
+    the listing already serialized as JSON (without distance_km, which
+    depends on the search origin). summary holds the compact form served to
+    list views.
+    """
+
+    __tablename__ = "listing_search"
+
+    web_slug = Column(
+        String,
+        ForeignKey("listings.web_slug", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    property_type = Column(Listing.property_type.type, nullable=False)
+
+    # Filters
+    price = Column(Float)
+    rooms = Column(Integer)
+    bathrooms = Column(Integer)
+    surface = Column(Float)
+    price_per_m2 = Column(Float)
+
+    # Location
+    latitude = Column(Float)
+    longitude = Column(Float)
+    distance_km = Column(Float)
+    geo_cell = Column(BigInteger, index=True)
+
+    # Dates (epoch seconds)
+    created_ts = Column(BigInteger)
+    modified_ts = Column(BigInteger)
+
+    # Spanish full-text search over the title (weight A) and description (B)
+    search_vector = Column(TSVECTOR)
+
+    # Serialized listing and its summary, and the listing hash identifying
+    # their content
+    hash = Column(BigInteger)
+    payload = Column(Text, nullable=False)
+    summary = Column(Text)
+    payload_version = Column(Integer, nullable=False)
+
+
+# Text search configuration of search_vector and search queries
+SEARCH_CONFIG = literal_column("'spanish'::regconfig")
+
+
+# Sort keys, with NULLs mapped to sortable defaults so they can be used for
+# keyset pagination. Each one is backed by a (key, web_slug) index.
+SORT_KEYS = {
+    "price": func.coalesce(ListingSearch.price, literal_column("0")),
+    "date": func.coalesce(ListingSearch.modified_ts, literal_column("0")),
+    "distance": func.coalesce(ListingSearch.distance_km, literal_column("999")),
+}
+
+Index("ix_listing_search_price_slug", SORT_KEYS["price"], ListingSearch.web_slug)
+Index("ix_listing_search_date_slug", SORT_KEYS["date"], ListingSearch.web_slug)
+Index(
+    "ix_listing_search_distance_slug", SORT_KEYS["distance"], ListingSearch.web_slug
+)
+Index(
+    "ix_listing_search_search_vector",
+    ListingSearch.search_vector,
+    postgresql_using="gin",
+)
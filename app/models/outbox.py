@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db import Base
+
+
+class OutboxNotification(Base):
+    """
+    Pending and sent Telegram notifications, one per listing. Rows are
+    written in the same transaction as the listing so none are lost, and
+    keyed by web_slug so a listing that is removed and re-added is not
+    notified twice. A worker claims rows by setting claimed_at, a lease that
+    other workers respect until TELEGRAM_OUTBOX_LEASE expires.
+    """
+
+    __tablename__ = "notification_outbox"
+
+    web_slug = Column(String, primary_key=True)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    claimed_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+Index(
+    "ix_notification_outbox_pending",
+    OutboxNotification.created_at,
+    postgresql_where=OutboxNotification.sent_at.is_(None),
+)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DateTime
+
+from app.db import Base
+from app.models.listing import Listing
+
+
+class RefreshState(Base):
+    """
+    When each property type was last refreshed and last fully swept. Shared
+    by all workers, so a worker skips a scheduled refresh another one has
+    just done and full sweeps follow FULL_SWEEP_INTERVAL across restarts.
+    """
+
+    __tablename__ = "refresh_state"
+
+    property_type = Column(Listing.property_type.type, primary_key=True)
+    refreshed_at = Column(DateTime)
+    full_sweep_at = Column(DateTime)
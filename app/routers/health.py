@@ -3,23 +3,22 @@ from datetime import datetime, timezone
 from fastapi import APIRouter
 from sqlalchemy import text
 
-from app.db import SessionLocal
+from app.db import AsyncSessionLocal
 from app.services.telegram import test_bot
 
 router = APIRouter(tags=["health"])
 
 
 @router.get("/health")
-def health_check():
+async def health_check():
     """Health check for server and database"""
     timestamp = datetime.now(timezone.utc).isoformat()
 
     # Check database connection
     db_status = "error"
     try:
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         db_status = "ok"
     except Exception as e:
         db_status = f"error: {str(e)[:50]}"
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from app.services.images import (
+    THUMB_MEDIA_TYPE,
+    ImageError,
+    get_thumbnail,
+    is_allowed,
+    thumbnail_key,
+)
+
+router = APIRouter(prefix="/api/images", tags=["images"])
+
+# The thumbnail of an image URL never changes
+CACHE_CONTROL = "public, max-age=2592000, immutable"
+
+
+@router.get("/thumb")
+async def get_image_thumbnail(
+    request: Request, url: str = Query(..., max_length=2048)
+):
+    """Resized thumbnail of a listing image, proxied and cached on disk"""
+    if not is_allowed(url):
+        raise HTTPException(status_code=400, detail="Image host not allowed")
+
+    etag = f'"{thumbnail_key(url)[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        thumbnail = await get_thumbnail(url)
+    except ImageError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return Response(content=thumbnail, media_type=THUMB_MEDIA_TYPE, headers=headers)
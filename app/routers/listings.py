@@ -1,19 +1,27 @@
 from typing import Optional
 
-from fastapi import APIRouter, Query
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import SQLAlchemyError
 
+from app.services.history import load_history, load_trends
 from app.services.listings import (
-    filter_listings,
-    get_stats,
-    load_listings,
-    sort_listings,
+    ListingQuery,
+    decode_cursor,
+    load_listing,
+    load_stats,
+    query_listings,
 )
 
 router = APIRouter(prefix="/api", tags=["listings"])
 
+# Reads that fail are 503s rather than empty results, so they aren't cached
+DATABASE_UNAVAILABLE = "Database unavailable"
+
 
 @router.get("/listings")
-def get_listings(
+async def get_listings(
     property_type: Optional[str] = Query(None),
     min_price: Optional[int] = Query(None),
     max_price: Optional[int] = Query(None),
@@ -22,45 +30,105 @@ def get_listings(
     min_bathrooms: Optional[int] = Query(None),
     max_bathrooms: Optional[int] = Query(None),
     max_distance: Optional[float] = Query(None),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=200),
+    q: Optional[str] = Query(None, max_length=200),
     sort_by: str = Query("price"),
     sort_order: str = Query("asc"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    fields: str = Query("full", pattern="^(full|summary)$"),
 ):
-    """Get listings with filters and pagination"""
-    listings = load_listings()
-
-    listings = filter_listings(
-        listings,
-        property_type=property_type,
-        min_price=min_price,
-        max_price=max_price,
-        min_rooms=min_rooms,
-        max_rooms=max_rooms,
-        min_bathrooms=min_bathrooms,
-        max_bathrooms=max_bathrooms,
-        max_distance=max_distance,
+    """
+    Get listings with filters and pagination (offset or cursor based), whole
+    or as summaries (fields=summary)
+    """
+    # A bad cursor is a client error, not an empty page
+    if cursor:
+        try:
+            decode_cursor(cursor, sort_by, sort_order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        total, listings, next_cursor = await query_listings(
+            ListingQuery(
+                property_type=property_type,
+                min_price=min_price,
+                max_price=max_price,
+                min_rooms=min_rooms,
+                max_rooms=max_rooms,
+                min_bathrooms=min_bathrooms,
+                max_bathrooms=max_bathrooms,
+                max_distance=max_distance,
+                lat=lat,
+                lon=lon,
+                radius_km=radius_km,
+                q=q.strip() if q else None,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                page=page,
+                page_size=page_size,
+                cursor=cursor,
+                fields=fields,
+            )
+        )
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail=DATABASE_UNAVAILABLE)
+
+    # Listings are already serialized, so they are spliced into the response
+    head = orjson.dumps(
+        {
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size,
+            "next_cursor": next_cursor,
+        }
     )
+    body = head[:-1] + b',"listings":[' + b",".join(listings) + b"]}"
+    return Response(content=body, media_type="application/json")
+
 
-    listings = sort_listings(listings, sort_by=sort_by, sort_order=sort_order)
+@router.get("/listings/{web_slug}/history", response_class=ORJSONResponse)
+async def get_listing_history(web_slug: str):
+    """Price and reserved status of a listing each time it changed"""
+    try:
+        history = await load_history(web_slug)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail=DATABASE_UNAVAILABLE)
+    return {"web_slug": web_slug, "history": history}
 
-    # Pagination
-    total = len(listings)
-    start = (page - 1) * page_size
-    end = start + page_size
-    paginated = listings[start:end]
 
-    return {
-        "total": total,
-        "page": page,
-        "page_size": page_size,
-        "pages": (total + page_size - 1) // page_size,
-        "listings": paginated,
-    }
+@router.get("/listings/{web_slug}", response_class=ORJSONResponse)
+async def get_listing(web_slug: str):
+    """A listing with all its fields and images"""
+    listing = await load_listing(web_slug)
+    if listing is None:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    return listing
 
 
-@router.get("/stats")
-def get_listings_stats():
+@router.get("/stats", response_class=ORJSONResponse)
+async def get_listings_stats():
     """General statistics"""
-    listings = load_listings()
-    return get_stats(listings)
+    try:
+        return await load_stats()
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail=DATABASE_UNAVAILABLE)
+
+
+@router.get("/stats/trends", response_class=ORJSONResponse)
+async def get_trends(
+    property_type: Optional[str] = Query(None),
+    city: Optional[str] = Query(None),
+    weeks: int = Query(12, ge=1, le=104),
+):
+    """Weekly price per m² by city"""
+    try:
+        trends = await load_trends(property_type, city, weeks)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail=DATABASE_UNAVAILABLE)
+    return {"weeks": weeks, "trends": trends}
@@ -1,19 +1,38 @@
-from fastapi import APIRouter, BackgroundTasks
+from typing import Optional
 
-from app.services.scraper import refresh_all_listings
+from fastapi import APIRouter, BackgroundTasks, Query
+
+from app.services.classifier import temporary_rental_matcher
+from app.services.scheduler import runner
 
 router = APIRouter(prefix="/api", tags=["scraper"])
 
 
 @router.post("/refresh")
-def refresh_listings():
-    """Update listings from Wallapop (synchronous)"""
-    result = refresh_all_listings()
+def refresh_listings(full: Optional[bool] = Query(None)):
+    """Update listings from Wallapop (synchronous, joins a running refresh)"""
+    result = runner.run(full=full)
     return result
 
 
 @router.post("/refresh/async")
-def refresh_listings_async(background_tasks: BackgroundTasks):
+def refresh_listings_async(
+    background_tasks: BackgroundTasks, full: Optional[bool] = Query(None)
+):
     """Update listings from Wallapop in background"""
-    background_tasks.add_task(refresh_all_listings)
+    if runner.running:
+        return {"message": "Refresh already running"}
+    background_tasks.add_task(runner.run, full=full, wait=False)
     return {"message": "Refresh started in background"}
+
+
+@router.get("/refresh/status")
+def refresh_status():
+    """Running, last and next scheduled refreshes"""
+    return runner.status()
+
+
+@router.get("/refresh/keywords")
+def temporary_rental_keywords():
+    """How many listings each temporary rental keyword filtered out"""
+    return temporary_rental_matcher.stats()
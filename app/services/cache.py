@@ -0,0 +1,221 @@
+"""
+Process-local cache for data derived from the listings table.
+
+Listings only change when a sync commits, so every cached value is tied
+to a data version: the shared counter a sync bumps once it committed its
+changes, which every process follows (the syncing one after its commit,
+the others when notified of it, see changes.py). Whole-table snapshots are
+kept once per version (computed once however many requests missed them)
+and filtered/sorted query results are kept in a bounded LRU.
+
+Compressed HTTP responses are also kept per version in a bounded LRU.
+Serialized listings are cached separately by form and content hash, which
+stays valid across versions.
+"""
+
+import asyncio
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.config import LISTINGS_CACHE_SIZE, PAYLOAD_CACHE_SIZE, RESPONSE_CACHE_SIZE
+from app.services.metrics import record_cache
+
+_lock = threading.Lock()
+# Local counter of cache invalidations, checked before storing computed values
+_version = 0
+# Shared data version, None until it has been read from the database
+_data_version: Optional[int] = None
+# Tags data while the shared version is unknown, unique to this process
+_instance = uuid.uuid4().hex[:8]
+_snapshots: OrderedDict = OrderedDict()
+_results: OrderedDict = OrderedDict()
+_payloads: OrderedDict = OrderedDict()
+_responses: OrderedDict = OrderedDict()
+# Snapshots being computed: a lock per name (threads), a task per name and
+# version (event loops)
+_loading: dict[str, threading.Lock] = {}
+_loading_async: dict[tuple[str, int], asyncio.Future] = {}
+# Marks a key missing from a cache (None may be a cached value)
+_MISS = object()
+
+
+def get_data_tag() -> str:
+    """
+    Current data version (for ETags): the shared one, the same in every
+    process, or one local to this process until that is known
+    """
+    if _data_version is None:
+        return f"{_instance}-{_version}"
+    return str(_data_version)
+
+
+def _clear():
+    """Drop everything cached for the previous version (lock held)"""
+    global _version
+    _version += 1
+    _snapshots.clear()
+    _results.clear()
+    _responses.clear()
+
+
+def set_data_version(version: int):
+    """
+    Follow the shared data version, invalidating the cache when it moved on
+    (versions notified out of order are ignored)
+    """
+    global _data_version
+    with _lock:
+        if _data_version is None or version > _data_version:
+            _data_version = version
+            _clear()
+
+
+def bump_version() -> int:
+    """Invalidate everything cached, keeping the data version"""
+    with _lock:
+        _clear()
+        return _version
+
+
+def _get(cache: OrderedDict, key: Hashable, kind: str) -> Any:
+    """Value cached for key, or _MISS, recording the hit or miss"""
+    with _lock:
+        value = cache.get(key, _MISS)
+        if value is not _MISS:
+            cache.move_to_end(key)
+    record_cache(kind, value is not _MISS)
+    return value
+
+
+def _put(
+    cache: OrderedDict, key: Hashable, value: Any, version: int, size: int = 0
+):
+    """
+    Cache a value computed at version, unless the data changed meanwhile,
+    keeping the cache to size entries (if given)
+    """
+    with _lock:
+        if version == _version:
+            cache[key] = value
+            cache.move_to_end(key)
+            while size and len(cache) > size:
+                cache.popitem(last=False)
+
+
+def _compute(
+    cache: OrderedDict, key: Hashable, compute: Callable[[], Any], size: int = 0
+) -> Any:
+    version = _version
+    value = compute()
+    _put(cache, key, value, version, size)
+    return value
+
+
+async def _compute_async(
+    cache: OrderedDict,
+    key: Hashable,
+    compute: Callable[[], Awaitable[Any]],
+    size: int = 0,
+) -> Any:
+    version = _version
+    value = await compute()
+    _put(cache, key, value, version, size)
+    return value
+
+
+def get_snapshot(name: str, compute: Callable[[], Any]) -> Any:
+    """
+    Get a whole-table value for the current version, computing it on a miss.
+    Concurrent misses wait for one computation.
+    """
+    value = _get(_snapshots, name, "snapshot")
+    if value is not _MISS:
+        return value
+    with _lock:
+        loading = _loading.setdefault(name, threading.Lock())
+    with loading:
+        # Computed meanwhile by the thread that held the lock
+        with _lock:
+            value = _snapshots.get(name, _MISS)
+        if value is _MISS:
+            value = _compute(_snapshots, name, compute)
+        return value
+
+
+async def get_snapshot_async(
+    name: str, compute: Callable[[], Awaitable[Any]]
+) -> Any:
+    """get_snapshot for an async compute function"""
+    value = _get(_snapshots, name, "snapshot")
+    if value is not _MISS:
+        return value
+    # One task per name and version, awaited by every request that missed
+    key = (name, _version)
+    task = _loading_async.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_compute_async(_snapshots, name, compute))
+        _loading_async[key] = task
+        task.add_done_callback(lambda _: _loading_async.pop(key, None))
+    # A cancelled request doesn't cancel the load others are waiting for
+    return await asyncio.shield(task)
+
+
+def get_result(key: Hashable, compute: Callable[[], Any]) -> Any:
+    """
+    Get a query result for the current version from the LRU, computing it on
+    a miss
+    """
+    value = _get(_results, key, "result")
+    if value is _MISS:
+        value = _compute(_results, key, compute, LISTINGS_CACHE_SIZE)
+    return value
+
+
+async def get_result_async(
+    key: Hashable, compute: Callable[[], Awaitable[Any]]
+) -> Any:
+    """get_result for an async compute function"""
+    value = _get(_results, key, "result")
+    if value is _MISS:
+        value = await _compute_async(_results, key, compute, LISTINGS_CACHE_SIZE)
+    return value
+
+
+def get_payload(key: tuple[str, int]) -> Optional[bytes]:
+    """Serialized listing by (form, content hash), if cached"""
+    with _lock:
+        payload = _payloads.get(key)
+        if payload is not None:
+            _payloads.move_to_end(key)
+    record_cache("payload", payload is not None)
+    return payload
+
+
+def put_payload(key: tuple[str, int], payload: bytes):
+    """Cache a serialized listing by (form, content hash)"""
+    with _lock:
+        _payloads[key] = payload
+        _payloads.move_to_end(key)
+        while len(_payloads) > PAYLOAD_CACHE_SIZE:
+            _payloads.popitem(last=False)
+
+
+def get_response(key: Hashable) -> Any:
+    """Cached response for the current version, if any"""
+    with _lock:
+        response = _responses.get(key)
+        if response is not None:
+            _responses.move_to_end(key)
+    record_cache("response", response is not None)
+    return response
+
+
+def put_response(key: Hashable, response: Any):
+    """Cache a response until the next version"""
+    with _lock:
+        _responses[key] = response
+        _responses.move_to_end(key)
+        while len(_responses) > RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
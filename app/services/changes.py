@@ -0,0 +1,62 @@
+"""
+Cache invalidation across processes.
+
+Once a sync has committed its changes to a property type's listings, it
+bumps the shared data version and notifies the new version on the
+listings_changed channel, in one transaction (so the notification is
+delivered on commit). Every process listens on the channel and follows the
+version, so all of them drop their caches and tag responses with the same
+version.
+"""
+
+import asyncio
+
+import psycopg
+from sqlalchemy import text, update
+
+from app.config import DATABASE_URL
+from app.models.data_version import DataVersion
+from app.services.cache import set_data_version
+
+CHANNEL = "listings_changed"
+
+# Seconds before reconnecting after the listening connection failed
+RECONNECT_SECONDS = 5
+
+
+def notify_change(db) -> int:
+    """
+    Bump the data version and notify other processes of it, once db
+    commits. Returns the new version. Concurrent syncs wait on the version
+    row, so versions are committed in order.
+    """
+    version = db.execute(
+        update(DataVersion)
+        .values(version=DataVersion.version + 1)
+        .returning(DataVersion.version)
+    ).scalar_one()
+    db.execute(
+        text("SELECT pg_notify(:channel, :version)"),
+        {"channel": CHANNEL, "version": str(version)},
+    )
+    return version
+
+
+async def listen_for_changes():
+    """Follow the data version notified by syncs (until cancelled)"""
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                DATABASE_URL, autocommit=True
+            ) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                # Changes may have been missed while not listening
+                cursor = await conn.execute("SELECT version FROM data_version")
+                row = await cursor.fetchone()
+                if row is not None:
+                    set_data_version(row[0])
+                async for notification in conn.notifies():
+                    set_data_version(int(notification.payload))
+        except psycopg.Error as e:
+            print(f"Listening for listing changes failed: {e}")
+            await asyncio.sleep(RECONNECT_SECONDS)
@@ -0,0 +1,116 @@
+import unicodedata
+from collections import Counter
+from typing import Iterator, Optional
+
+import ahocorasick
+
+from app.config import TEMPORARY_RENTAL_KEYWORDS
+
+# Keywords shorter than this must be whole words (or plurals), as they often
+# start unrelated words ("mayo" in "mayores"); longer ones may have a suffix
+# ("temporal" in "temporalmente")
+WHOLE_WORD_LENGTH = 6
+
+# Accented forms of the vowels in Spanish spelling
+ACCENTED_VOWELS = {"a": "á", "e": "é", "i": "í", "o": "ó", "u": "úü"}
+
+
+def fold(text: str) -> str:
+    """Lowercase text and strip accents (and other non-ASCII characters)"""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return text.lower()
+
+
+def spellings(keyword: str) -> set[str]:
+    """
+    Spellings of a folded keyword as texts may write it: each word with or
+    without one accented vowel (Spanish words carry at most one accent), and
+    with any n written as ñ
+    """
+    spelled = [""]
+    for word in keyword.split(" "):
+        forms = {word}
+        for index, char in enumerate(word):
+            if char == "n":
+                forms |= {form[:index] + "ñ" + form[index + 1 :] for form in forms}
+        for form in list(forms):
+            for index, char in enumerate(form):
+                for accented in ACCENTED_VOWELS.get(char, ""):
+                    forms.add(form[:index] + accented + form[index + 1 :])
+        spelled = [f"{prefix} {form}".lstrip() for prefix in spelled for form in forms]
+    return set(spelled)
+
+
+def ends_word(text: str, index: int) -> bool:
+    """Whether a word ends at index, or right after a plural ending there"""
+    for suffix in ("", "s", "es"):
+        after = index + len(suffix)
+        if text.startswith(suffix, index) and (
+            after == len(text) or not text[after].isalnum()
+        ):
+            return True
+    return False
+
+
+class KeywordMatcher:
+    """
+    Finds keywords in one pass of an Aho-Corasick automaton. Keywords match
+    at the start of a word, ignoring case and accents: the automaton holds
+    every spelling of each keyword, so texts are only lowercased (and
+    composed, if written with combining accents). Counts how many texts each
+    keyword matched first, to help tune the list.
+    """
+
+    def __init__(self, keywords: list[str]):
+        # Keywords differing only by accents collapse into one
+        self.keywords = list(dict.fromkeys(fold(keyword) for keyword in keywords))
+        self.automaton = ahocorasick.Automaton()
+        for keyword in self.keywords:
+            whole_word = len(keyword) < WHOLE_WORD_LENGTH
+            for variant in spellings(keyword):
+                self.automaton.add_word(variant, (keyword, len(variant), whole_word))
+        self.automaton.make_automaton()
+        self.checked = 0
+        self.matched = 0
+        self.hits: Counter[str] = Counter()
+
+    def _find(self, text: str) -> Iterator[str]:
+        if not text.isascii() and not unicodedata.is_normalized("NFC", text):
+            text = unicodedata.normalize("NFC", text)
+        text = text.lower()
+        for end, (keyword, length, whole_word) in self.automaton.iter(text):
+            start = end - length + 1
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if whole_word and not ends_word(text, end + 1):
+                continue
+            yield keyword
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        First keyword in text, if any, counted as the one that matched it
+        (the scan stops there)
+        """
+        keyword = next(self._find(text), None)
+        # Counted without a lock: concurrent updates may only skew the stats
+        self.checked += 1
+        if keyword is not None:
+            self.matched += 1
+            self.hits[keyword] += 1
+        return keyword
+
+    def search(self, text: str) -> bool:
+        """Whether any keyword is in text (not counted)"""
+        return next(self._find(text), None) is not None
+
+    def stats(self) -> dict:
+        """Texts checked and matched, and texts matched by each keyword"""
+        return {
+            "checked": self.checked,
+            "matched": self.matched,
+            "hits": {keyword: self.hits[keyword] for keyword in self.keywords},
+        }
+
+
+temporary_rental_matcher = KeywordMatcher(TEMPORARY_RENTAL_KEYWORDS)
@@ -0,0 +1,141 @@
+"""
+Columnar representation of listings for vectorized filtering and stats.
+
+Each attribute is a NumPy array aligned with the listings list, with NaN
+for missing values, so filters combine into a boolean mask and stats are
+array reductions instead of passes over dicts.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from app.models.listing import PropertyType
+from app.services.geo import haversine_array
+
+PROPERTY_TYPE_CODES = {
+    property_type.value: code for code, property_type in enumerate(PropertyType)
+}
+
+
+def _column(values) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _epoch(value: Optional[str]) -> float:
+    if not value:
+        return np.nan
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (ValueError, TypeError):
+        return np.nan
+
+
+class ListingColumns:
+    """Parallel arrays of listing attributes"""
+
+    def __init__(self, listings: list[dict]):
+        self.listings = listings
+
+        locations = [listing.get("location") or {} for listing in listings]
+        attributes = [listing.get("type_attributes") or {} for listing in listings]
+
+        self.price = _column(listing.get("price") for listing in listings)
+        self.rooms = _column(attrs.get("rooms") for attrs in attributes)
+        self.bathrooms = _column(attrs.get("bathrooms") for attrs in attributes)
+        self.surface = _column(attrs.get("surface") for attrs in attributes)
+        self.latitude = _column(location.get("latitude") for location in locations)
+        self.longitude = _column(location.get("longitude") for location in locations)
+        self.distance = _column(listing.get("distance_km") for listing in listings)
+        self.property_type = np.array(
+            [
+                PROPERTY_TYPE_CODES.get(listing["property_type"], -1)
+                for listing in listings
+            ],
+            dtype=np.int8,
+        )
+        self.modified_at = np.array(
+            [_epoch(listing.get("modified_at")) for listing in listings],
+            dtype=np.float64,
+        )
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def mask(
+        self,
+        property_type: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        min_rooms: Optional[int] = None,
+        max_rooms: Optional[int] = None,
+        min_bathrooms: Optional[int] = None,
+        max_bathrooms: Optional[int] = None,
+        max_distance: Optional[float] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        radius_km: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Boolean mask of listings matching the filters (NaN never matches).
+        Distances are from (lat, lon) when given, else from the base point.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if property_type:
+            mask &= self.property_type == PROPERTY_TYPE_CODES.get(property_type, -2)
+        if min_price is not None:
+            mask &= self.price >= min_price
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if min_rooms is not None:
+            mask &= self.rooms >= min_rooms
+        if max_rooms is not None:
+            mask &= self.rooms <= max_rooms
+        if min_bathrooms is not None:
+            mask &= self.bathrooms >= min_bathrooms
+        if max_bathrooms is not None:
+            mask &= self.bathrooms <= max_bathrooms
+        if max_distance is not None or radius_km is not None:
+            distance = self.distances_from(lat, lon)
+            if max_distance is not None:
+                mask &= distance <= max_distance
+            if radius_km is not None and lat is not None and lon is not None:
+                mask &= distance <= radius_km
+        return mask
+
+    def distances_from(
+        self, lat: Optional[float] = None, lon: Optional[float] = None
+    ) -> np.ndarray:
+        """Distances in km from (lat, lon), or the stored ones from the base point"""
+        if lat is None or lon is None:
+            return self.distance
+        return np.round(haversine_array(lat, lon, self.latitude, self.longitude), 1)
+
+    def select(self, mask: np.ndarray) -> list[dict]:
+        """Listings selected by a mask, in their original order"""
+        return [self.listings[i] for i in np.flatnonzero(mask)]
+
+    def stats(self) -> dict:
+        """Calculate statistics of listings"""
+
+        def value_range(values: np.ndarray, cast=float) -> dict:
+            # Missing and zero values are ignored
+            values = values[~np.isnan(values) & (values != 0)]
+            if not values.size:
+                return {"min": 0, "max": 0}
+            return {"min": cast(values.min()), "max": cast(values.max())}
+
+        return {
+            "total": len(self),
+            "apartments": int(
+                np.count_nonzero(self.property_type == PROPERTY_TYPE_CODES["apartment"])
+            ),
+            "houses": int(
+                np.count_nonzero(self.property_type == PROPERTY_TYPE_CODES["house"])
+            ),
+            "price": value_range(self.price),
+            "rooms": value_range(self.rooms, int),
+            "bathrooms": value_range(self.bathrooms, int),
+            "distance": value_range(self.distance),
+        }
@@ -1,9 +1,22 @@
 import math
 
+import numpy as np
+from sqlalchemy import Float, Numeric, and_, cast, func, or_
+
+EARTH_RADIUS_KM = 6371
+# Length of a degree of latitude on the sphere used for distances
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Spatial grid: listings are bucketed into cells of GRID_CELL_DEGREES, numbered
+# row by row, so the cells within a radius form one contiguous range per row
+GRID_CELL_DEGREES = 0.05
+GRID_ROWS = math.ceil(180 / GRID_CELL_DEGREES)
+GRID_COLUMNS = math.ceil(360 / GRID_CELL_DEGREES)
+
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Calculate distance in km between two points using Haversine formula"""
-    R = 6371
+    R = EARTH_RADIUS_KM
     lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
@@ -13,3 +26,81 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     )
     c = 2 * math.asin(math.sqrt(a))
     return R * c
+
+
+def haversine_array(
+    lat: float, lon: float, lats: np.ndarray, lons: np.ndarray
+) -> np.ndarray:
+    """Haversine distance in km from a point to arrays of points (NaN if missing)"""
+    lat1 = math.radians(lat)
+    lon1 = math.radians(lon)
+    lat2 = np.radians(lats)
+    lon2 = np.radians(lons)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+
+
+def haversine_sql(lat: float, lon: float, lat_column, lon_column):
+    """
+    Haversine distance in km from a fixed point, as a SQL expression rounded
+    to 0.1
+    """
+    lat1 = math.radians(lat)
+    lon1 = math.radians(lon)
+    lat2 = func.radians(lat_column)
+    lon2 = func.radians(lon_column)
+    a = func.power(func.sin((lat2 - lat1) * 0.5), 2) + math.cos(lat1) * func.cos(
+        lat2
+    ) * func.power(func.sin((lon2 - lon1) * 0.5), 2)
+    distance = EARTH_RADIUS_KM * 2 * func.asin(func.sqrt(a))
+    return cast(func.round(cast(distance, Numeric), 1), Float)
+
+
+def grid_cell(lat: float, lon: float) -> int:
+    """Grid cell containing a point"""
+    row = math.floor((lat + 90) / GRID_CELL_DEGREES)
+    column = math.floor((lon + 180) / GRID_CELL_DEGREES)
+    return row * GRID_COLUMNS + column
+
+
+def grid_cell_sql(lat_column, lon_column):
+    """Grid cell containing a point, as a SQL expression"""
+    row = func.floor((lat_column + 90) / GRID_CELL_DEGREES)
+    column = func.floor((lon_column + 180) / GRID_CELL_DEGREES)
+    return row * GRID_COLUMNS + column
+
+
+def grid_cells_within(
+    lat: float, lon: float, radius_km: float
+) -> list[tuple[int, int]]:
+    """
+    Ranges of grid cells (first, last) covering a circle's bounding box,
+    padded by one cell on each side against rounding at the edges
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    # The circle is widest in longitude towards the pole
+    widest = min(abs(lat) + dlat, 90)
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(widest)), 0.01))
+    first_row = max(math.floor((lat - dlat + 90) / GRID_CELL_DEGREES) - 1, 0)
+    last_row = min(math.floor((lat + dlat + 90) / GRID_CELL_DEGREES) + 1, GRID_ROWS - 1)
+    first_column = max(math.floor((lon - dlon + 180) / GRID_CELL_DEGREES) - 1, 0)
+    last_column = min(
+        math.floor((lon + dlon + 180) / GRID_CELL_DEGREES) + 1, GRID_COLUMNS - 1
+    )
+    return [
+        (row * GRID_COLUMNS + first_column, row * GRID_COLUMNS + last_column)
+        for row in range(first_row, last_row + 1)
+    ]
+
+
+def grid_cells_condition(cell_column, lat: float, lon: float, radius_km: float):
+    """SQL condition restricting a grid cell column to the cells around a point"""
+    return or_(
+        *[
+            and_(cell_column >= first, cell_column <= last)
+            for first, last in grid_cells_within(lat, lon, radius_km)
+        ]
+    )
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Numeric, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import AsyncSessionLocal
+from app.models.history import ListingHistory
+from app.models.listing import Listing, PropertyType
+from app.services.cache import get_result_async
+
+
+def add_history(db, rows: list[dict]):
+    """Record an observation of each Listing row (committed by the caller)"""
+    if not rows:
+        return
+    observed_at = datetime.utcnow()
+    stmt = insert(ListingHistory).values(
+        [
+            {
+                "web_slug": row["web_slug"],
+                "observed_at": observed_at,
+                "price": row["price"],
+                "reserved": row["reserved"],
+                "property_type": row["property_type"],
+                "city": row["city"],
+                "surface": row["surface"],
+                "hash": row["hash"],
+            }
+            for row in rows
+        ]
+    )
+    db.execute(stmt.on_conflict_do_nothing())
+
+
+def seed_history(db):
+    """Record a first observation of listings stored before history existed"""
+    db.execute(
+        insert(ListingHistory).from_select(
+            [
+                "web_slug",
+                "observed_at",
+                "price",
+                "reserved",
+                "property_type",
+                "city",
+                "surface",
+                "hash",
+            ],
+            select(
+                Listing.web_slug,
+                func.coalesce(
+                    Listing.modified_at,
+                    Listing.created_at,
+                    func.timezone("utc", func.now()),
+                ),
+                Listing.price,
+                Listing.reserved,
+                Listing.property_type,
+                Listing.city,
+                Listing.surface,
+                Listing.hash,
+            ).where(
+                ~select(ListingHistory.web_slug)
+                .where(ListingHistory.web_slug == Listing.web_slug)
+                .exists()
+            ),
+        )
+    )
+
+
+def backfill_history(db):
+    """
+    Fill the listing attributes of observations recorded before history
+    stored them (those of removed listings stay empty)
+    """
+    db.execute(
+        update(ListingHistory)
+        .where(
+            ListingHistory.property_type.is_(None),
+            ListingHistory.web_slug == Listing.web_slug,
+        )
+        .values(
+            property_type=Listing.property_type,
+            city=Listing.city,
+            surface=Listing.surface,
+        )
+    )
+
+
+async def load_history(web_slug: str) -> list[dict]:
+    """Observations of a listing, oldest first"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(
+                ListingHistory.observed_at,
+                ListingHistory.price,
+                ListingHistory.reserved,
+            )
+            .where(ListingHistory.web_slug == web_slug)
+            .order_by(ListingHistory.observed_at)
+        )
+        return [
+            {
+                "observed_at": observed_at.isoformat(),
+                "price": price,
+                "reserved": reserved,
+            }
+            for observed_at, price, reserved in result
+        ]
+
+
+async def _load_trends(
+    property_type: Optional[str], city: Optional[str], weeks: int
+) -> list[dict]:
+    # Inlined so GROUP BY matches the selected expression
+    week = func.date_trunc(literal_column("'week'"), ListingHistory.observed_at).label(
+        "week"
+    )
+    price_per_m2 = ListingHistory.price / ListingHistory.surface
+    query = (
+        select(
+            week,
+            ListingHistory.city,
+            func.count(func.distinct(ListingHistory.web_slug)),
+            func.round(func.avg(price_per_m2).cast(Numeric), 2),
+            func.percentile_cont(0.5).within_group(price_per_m2),
+        )
+        .where(
+            ListingHistory.observed_at >= datetime.utcnow() - timedelta(weeks=weeks),
+            ListingHistory.price > 0,
+            ListingHistory.surface > 0,
+        )
+        .group_by(week, ListingHistory.city)
+        .order_by(week, ListingHistory.city)
+    )
+    if property_type:
+        query = query.where(ListingHistory.property_type == PropertyType(property_type))
+    if city:
+        query = query.where(func.lower(ListingHistory.city) == city.lower())
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        return [
+            {
+                "week": week.date().isoformat(),
+                "city": city,
+                "listings": listings,
+                "avg_price_per_m2": float(avg),
+                "median_price_per_m2": round(median, 2),
+            }
+            for week, city, listings, avg, median in result
+        ]
+
+
+async def load_trends(
+    property_type: Optional[str] = None, city: Optional[str] = None, weeks: int = 12
+) -> list[dict]:
+    """
+    Average and median price per m² of the prices observed each week (new
+    and changed listings, including those removed since), by city (cached
+    until the next sync). Database errors are raised.
+    """
+    try:
+        return await get_result_async(
+            ("trends", property_type, city, weeks),
+            lambda: _load_trends(property_type, city, weeks),
+        )
+    except (ValueError, TypeError):
+        # Invalid property type - no trends
+        return []
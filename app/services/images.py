@@ -0,0 +1,216 @@
+"""
+Thumbnails of listing images, served through /api/images/thumb.
+
+Wallapop image URLs are immutable, so a thumbnail is stored once on disk
+under a hash of its source URL and width and served from there until it is
+evicted. The cache is bounded in bytes and evicts the least recently used
+files (reads refresh a file's mtime). Sources are fetched through one shared
+client and given up on past IMAGE_SOURCE_MAX_MB.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+import httpx
+from PIL import Image, UnidentifiedImageError
+
+from app.config import (
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_MB,
+    IMAGE_PROXY_HOSTS,
+    IMAGE_SOURCE_MAX_MB,
+    IMAGE_THUMB_QUALITY,
+    IMAGE_THUMB_WIDTH,
+)
+from app.services.metrics import record_cache
+
+THUMB_MEDIA_TYPE = "image/webp"
+SOURCE_MAX_BYTES = IMAGE_SOURCE_MAX_MB * 1024 * 1024
+
+
+class ImageError(Exception):
+    """An image could not be fetched or decoded"""
+
+
+class DiskCache:
+    """Files on disk named by key, evicting the least recently used ones"""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes on disk, counted on the first write
+        self._size: Optional[int] = None
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        """(mtime, size, path) of the cached files"""
+        entries = []
+        for path in self.directory.glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so readers never see a partial file
+        tmp = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(data)
+        with self._lock:
+            # An overwritten file no longer counts towards the size
+            try:
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp, path)
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove the oldest files down to 90% of the limit (lock held)"""
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, file_size, path in entries:
+            if size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            size -= file_size
+        self._size = size
+
+
+cache = DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB * 1024 * 1024)
+
+# Shared by all fetches so connections to the image hosts are reused
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=10.0, follow_redirects=False)
+    return _client
+
+
+async def close_client():
+    """Close the shared client (on shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def is_allowed(url: str) -> bool:
+    """Whether url is an https URL of an image host the proxy serves"""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    return parts.scheme == "https" and any(
+        host == allowed or host.endswith("." + allowed)
+        for allowed in IMAGE_PROXY_HOSTS
+    )
+
+
+def thumbnail_url(image_sizes: Optional[list[dict]], images: Optional[list[str]]):
+    """
+    Proxy URL of the thumbnail of a listing's first image, if any. The source
+    is the smallest size at least as wide as a thumbnail: the medium one,
+    else the full image, else the small one.
+    """
+    sizes = image_sizes[0] if image_sizes else {}
+    source = sizes.get("medium") or (images[0] if images else None)
+    source = source or sizes.get("small")
+    if not source:
+        return None
+    return f"/api/images/thumb?url={quote(source, safe='')}"
+
+
+def make_thumbnail(data: bytes, width: int) -> bytes:
+    """WebP of an image scaled down to width pixels"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((width, width * 4))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, "WEBP", quality=IMAGE_THUMB_QUALITY)
+    except (
+        UnidentifiedImageError,
+        Image.DecompressionBombError,
+        OSError,
+        ValueError,
+    ) as e:
+        raise ImageError(f"Cannot decode image: {e}") from e
+    return output.getvalue()
+
+
+def _store_thumbnail(key: str, data: bytes, width: int) -> bytes:
+    thumbnail = make_thumbnail(data, width)
+    cache.put(key, thumbnail)
+    return thumbnail
+
+
+def thumbnail_key(url: str, width: int = IMAGE_THUMB_WIDTH) -> str:
+    """Cache key of the thumbnail of an image URL"""
+    return hashlib.sha256(f"{width}:{url}".encode()).hexdigest()
+
+
+async def download(url: str) -> bytes:
+    """Body of an image URL, streamed and given up on past SOURCE_MAX_BYTES"""
+    data = bytearray()
+    try:
+        async with get_client().stream("GET", url) as response:
+            response.raise_for_status()
+            length = response.headers.get("content-length", "")
+            if length.isdigit() and int(length) > SOURCE_MAX_BYTES:
+                raise ImageError(f"Image too large: {length} bytes")
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > SOURCE_MAX_BYTES:
+                    raise ImageError(f"Image too large: over {len(data)} bytes")
+    except httpx.HTTPError as e:
+        raise ImageError(f"Cannot fetch image: {e}") from e
+    return bytes(data)
+
+
+async def get_thumbnail(url: str, width: int = IMAGE_THUMB_WIDTH) -> bytes:
+    """Thumbnail of an image URL, from the disk cache or fetched and resized"""
+    key = thumbnail_key(url, width)
+    thumbnail = await asyncio.to_thread(cache.get, key)
+    record_cache("images", thumbnail is not None)
+    if thumbnail is not None:
+        return thumbnail
+
+    data = await download(url)
+    # Resizing is CPU bound, so it runs off the event loop with the write
+    return await asyncio.to_thread(_store_thumbnail, key, data, width)
@@ -1,66 +1,69 @@
+import base64
+import json
+from dataclasses import dataclass
 from typing import Optional
 
-from app.config import BASE_LAT, BASE_LON
-from app.db import SessionLocal
-from app.models.listing import Listing
-from app.services.geo import haversine_distance
+import orjson
+from sqlalchemy import Float, cast, func, literal, literal_column, select, tuple_
 
+from app.db import AsyncSessionLocal, SessionLocal
+from app.models.listing import Listing, PropertyType
+from app.models.listing_search import SEARCH_CONFIG, SORT_KEYS, ListingSearch
+from app.services.cache import (
+    get_payload,
+    get_result_async,
+    get_snapshot,
+    get_snapshot_async,
+    put_payload,
+)
+from app.services.columnar import ListingColumns
+from app.services.geo import grid_cells_condition, haversine_sql
 
-def load_listings() -> list[dict]:
-    """Load listings from database"""
+
+# Projection column holding each form of a serialized listing: everything,
+# or a summary for list views
+FIELDS = {
+    "full": ListingSearch.payload,
+    "summary": ListingSearch.summary,
+}
+
+
+def listing_to_dict(listing: Listing) -> dict:
+    """Convert a Listing row to the API dictionary format"""
+    return {
+        "web_slug": listing.web_slug,
+        "property_type": listing.property_type.value,
+        "title": listing.title,
+        "description": listing.description,
+        "price": listing.price,
+        "images": listing.images or [],
+        "reserved": listing.reserved,
+        "location": {
+            "latitude": listing.latitude,
+            "longitude": listing.longitude,
+            "postal_code": listing.postal_code,
+            "city": listing.city,
+            "region": listing.region,
+            "country_code": listing.country_code,
+        },
+        "type_attributes": {
+            "operation": listing.operation,
+            "surface": listing.surface,
+            "rooms": listing.rooms,
+            "bathrooms": listing.bathrooms,
+        },
+        "created_at": listing.created_at.isoformat() if listing.created_at else None,
+        "modified_at": listing.modified_at.isoformat()
+        if listing.modified_at
+        else None,
+        "distance_km": listing.distance_km,
+    }
+
+
+def _load_listings() -> list[dict]:
     db = SessionLocal()
     try:
-        listings_db = db.query(Listing).all()
-        listings = []
-
-        for listing in listings_db:
-            item = {
-                "web_slug": listing.web_slug,
-                "property_type": listing.property_type.value,
-                "title": listing.title,
-                "description": listing.description,
-                "price": listing.price,
-                "images": listing.images or [],
-                "reserved": listing.reserved,
-                "location": {
-                    "latitude": listing.latitude,
-                    "longitude": listing.longitude,
-                    "postal_code": listing.postal_code,
-                    "city": listing.city,
-                    "region": listing.region,
-                    "country_code": listing.country_code,
-                },
-                "type_attributes": {
-                    "operation": listing.operation,
-                    "surface": listing.surface,
-                    "rooms": listing.rooms,
-                    "bathrooms": listing.bathrooms,
-                },
-                "created_at": listing.created_at.isoformat()
-                if listing.created_at
-                else None,
-                "modified_at": listing.modified_at.isoformat()
-                if listing.modified_at
-                else None,
-            }
-
-            # Calculate distance
-            if listing.latitude and listing.longitude:
-                item["distance_km"] = round(
-                    haversine_distance(
-                        BASE_LAT, BASE_LON, listing.latitude, listing.longitude
-                    ),
-                    1,
-                )
-            else:
-                item["distance_km"] = None
-
-            listings.append(item)
-
-        return listings
-    except (ValueError, TypeError, RuntimeError, Exception):
-        # Database connection error - return empty list
-        return []
+        return [listing_to_dict(listing) for listing in db.query(Listing).all()]
     finally:
         try:
             db.close()
@@ -68,8 +71,82 @@ def load_listings() -> list[dict]:
             pass
 
 
-def filter_listings(
-    listings: list[dict],
+def load_listings() -> list[dict]:
+    """Load listings from database (cached until the next sync)"""
+    try:
+        # Copy so callers sorting in place don't reorder the cached snapshot
+        return list(get_snapshot("listings", _load_listings))
+    except (ValueError, TypeError, RuntimeError, Exception):
+        # Database connection error - return empty list
+        return []
+
+
+def load_columns() -> ListingColumns:
+    """Columnar view of all listings (rebuilt after each sync)"""
+    try:
+        return get_snapshot(
+            "columns",
+            lambda: ListingColumns(get_snapshot("listings", _load_listings)),
+        )
+    except (ValueError, TypeError, RuntimeError, Exception):
+        # Database connection error - no listings
+        return ListingColumns([])
+
+
+async def _load_listings_async() -> list[dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Listing))
+        return [listing_to_dict(listing) for listing in result.scalars()]
+
+
+async def _load_columns_async() -> ListingColumns:
+    return ListingColumns(await get_snapshot_async("listings", _load_listings_async))
+
+
+async def _load_stats_async() -> dict:
+    return (await get_snapshot_async("columns", _load_columns_async)).stats()
+
+
+async def load_stats() -> dict:
+    """
+    Statistics of all listings (cached until the next sync). Database errors
+    are raised, so they are never cached as stats of no listings
+    """
+    return await get_snapshot_async("stats", _load_stats_async)
+
+
+def distance_column(lat: Optional[float] = None, lon: Optional[float] = None):
+    """Distance in km from (lat, lon), or the stored distance from the base point"""
+    if lat is None or lon is None:
+        return ListingSearch.distance_km
+    return haversine_sql(lat, lon, ListingSearch.latitude, ListingSearch.longitude)
+
+
+def search_query(q: str):
+    """SQL tsquery of a web-style search ("quoted phrases", -excluded words)"""
+    return func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+
+def sort_key(
+    sort_by: str,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    q: Optional[str] = None,
+):
+    """SQL sort key, or None for unknown sorts"""
+    if sort_by == "distance" and lat is not None and lon is not None:
+        return func.coalesce(distance_column(lat, lon), literal_column("999"))
+    if sort_by == "relevance":
+        if not q:
+            return None
+        # ts_rank_cd is a real, which a cursor value (a double) never equals
+        return cast(
+            func.ts_rank_cd(ListingSearch.search_vector, search_query(q)), Float
+        )
+    return SORT_KEYS.get(sort_by)
+
+
+def build_filters(
     property_type: Optional[str] = None,
     min_price: Optional[int] = None,
     max_price: Optional[int] = None,
@@ -78,49 +155,327 @@ def filter_listings(
     min_bathrooms: Optional[int] = None,
     max_bathrooms: Optional[int] = None,
     max_distance: Optional[float] = None,
-) -> list[dict]:
-    """Apply filters to listings"""
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    q: Optional[str] = None,
+) -> list:
+    """
+    Build SQL filter conditions for listings.
+    Distances are from (lat, lon) when given, else from the base point, and
+    q matches listings by the words of their title and description.
+    """
+    conditions = []
     if property_type:
-        listings = [
-            listing for listing in listings if listing["property_type"] == property_type
-        ]
+        conditions.append(ListingSearch.property_type == PropertyType(property_type))
     if min_price is not None:
-        listings = [
-            listing for listing in listings if listing.get("price", 0) >= min_price
-        ]
+        conditions.append(ListingSearch.price >= min_price)
     if max_price is not None:
-        listings = [
-            listing for listing in listings if listing.get("price", 0) <= max_price
-        ]
+        conditions.append(ListingSearch.price <= max_price)
     if min_rooms is not None:
-        listings = [
-            listing for listing in listings if listing.get("rooms", 0) >= min_rooms
-        ]
+        conditions.append(ListingSearch.rooms >= min_rooms)
     if max_rooms is not None:
-        listings = [
-            listing for listing in listings if listing.get("rooms", 0) <= max_rooms
-        ]
+        conditions.append(ListingSearch.rooms <= max_rooms)
     if min_bathrooms is not None:
-        listings = [
-            listing
-            for listing in listings
-            if listing.get("bathrooms", 0) >= min_bathrooms
-        ]
+        conditions.append(ListingSearch.bathrooms >= min_bathrooms)
     if max_bathrooms is not None:
-        listings = [
-            listing
-            for listing in listings
-            if listing.get("bathrooms", 0) <= max_bathrooms
-        ]
+        conditions.append(ListingSearch.bathrooms <= max_bathrooms)
     if max_distance is not None:
+        conditions.append(distance_column(lat, lon) <= max_distance)
+    if radius_km is not None and lat is not None and lon is not None:
+        # Grid cells narrow down candidates through the index before the
+        # exact distance check
+        conditions.append(
+            grid_cells_condition(ListingSearch.geo_cell, lat, lon, radius_km)
+        )
+        conditions.append(distance_column(lat, lon) <= radius_km)
+    if q:
+        conditions.append(ListingSearch.search_vector.op("@@")(search_query(q)))
+    return conditions
+
+
+def build_order(
+    sort_by: str = "price",
+    sort_order: str = "asc",
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    q: Optional[str] = None,
+) -> list:
+    """Build SQL ORDER BY clauses for listings, with web_slug as tiebreaker"""
+    key = sort_key(sort_by, lat, lon, q)
+    if key is None:
+        return [ListingSearch.web_slug]
+    if sort_order == "desc":
+        return [key.desc(), ListingSearch.web_slug.desc()]
+    return [key, ListingSearch.web_slug]
+
+
+def encode_cursor(value, web_slug: str, sort_by: str, sort_order: str) -> str:
+    """Encode the position after a listing (its sort key value and slug) as a cursor"""
+    payload = json.dumps([sort_by, sort_order, value, web_slug])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    """
+    Decode a cursor into (sort key value, web_slug).
+    Raises ValueError if it is malformed or was made for another sort.
+    """
+    try:
+        cursor_sort_by, cursor_sort_order, value, web_slug = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(web_slug, str) or not (
+        value is None or type(value) in (int, float)
+    ):
+        raise ValueError("Invalid cursor")
+    if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order):
+        raise ValueError("Cursor does not match the requested sort")
+    return value, web_slug
+
+
+def cursor_condition(
+    cursor: str,
+    sort_by: str,
+    sort_order: str,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    q: Optional[str] = None,
+):
+    """Build the keyset condition selecting listings after a cursor"""
+    value, web_slug = decode_cursor(cursor, sort_by, sort_order)
+
+    key = sort_key(sort_by, lat, lon, q)
+    if key is None:
+        position = ListingSearch.web_slug
+        last = literal(web_slug)
+    else:
+        position = tuple_(key, ListingSearch.web_slug)
+        last = tuple_(literal(value), literal(web_slug))
+
+    if sort_order == "desc":
+        return position < last
+    return position > last
+
+
+def with_distance(payload: bytes, distance_km: Optional[float]) -> bytes:
+    """Add distance_km to a serialized listing"""
+    return payload[:-1] + b',"distance_km":' + orjson.dumps(distance_km) + b"}"
+
+
+def with_headline(payload: bytes, headline: Optional[str]) -> bytes:
+    """Add the search headline (matches in <mark>) to a serialized listing"""
+    return payload[:-1] + b',"headline":' + orjson.dumps(headline) + b"}"
+
+
+async def load_headlines(db, web_slugs: list[str], q: str) -> dict[str, str]:
+    """Snippets of the descriptions of listings around the words matching q"""
+    headline = func.ts_headline(
+        SEARCH_CONFIG,
+        func.coalesce(Listing.description, Listing.title, ""),
+        search_query(q),
+        literal_column(
+            "'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, "
+            "MaxWords=20, MinWords=8'"
+        ),
+    )
+    result = await db.execute(
+        select(Listing.web_slug, headline).where(Listing.web_slug.in_(web_slugs))
+    )
+    return dict(result.all())
+
+
+async def load_payloads(
+    db, rows: list[tuple[str, int]], fields: str = "full"
+) -> dict[str, bytes]:
+    """
+    Serialized listings (in the form named by fields) for (web_slug, hash)
+    pairs, from the payload cache or, on a miss, from the projection table.
+    """
+    payloads = {}
+    missing = []
+    for web_slug, listing_hash in rows:
+        payload = get_payload((fields, listing_hash)) if listing_hash else None
+        if payload is None:
+            missing.append(web_slug)
+        else:
+            payloads[web_slug] = payload
+
+    if missing:
+        result = await db.execute(
+            select(ListingSearch.web_slug, ListingSearch.hash, FIELDS[fields]).where(
+                ListingSearch.web_slug.in_(missing)
+            )
+        )
+        for web_slug, listing_hash, payload in result:
+            payloads[web_slug] = payload.encode()
+            if listing_hash:
+                put_payload((fields, listing_hash), payloads[web_slug])
+
+    return payloads
+
+
+@dataclass(frozen=True)
+class ListingQuery:
+    """
+    Filters, sort and page of a listings query. Frozen, so a query is also
+    its own cache key.
+    """
+
+    property_type: Optional[str] = None
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_rooms: Optional[int] = None
+    max_rooms: Optional[int] = None
+    min_bathrooms: Optional[int] = None
+    max_bathrooms: Optional[int] = None
+    max_distance: Optional[float] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_km: Optional[float] = None
+    q: Optional[str] = None
+    sort_by: str = "price"
+    sort_order: str = "asc"
+    page: int = 1
+    page_size: int = 20
+    cursor: Optional[str] = None
+    fields: str = "full"
+
+
+async def query_listings(
+    query: ListingQuery,
+) -> tuple[int, list[bytes], Optional[str]]:
+    """
+    Filter, sort and paginate listings in the database.
+    With a cursor, the page starts right after the cursor position instead
+    of at an offset. With lat/lon, distances are measured from that point
+    and radius_km limits results to a circle around it. With q, only
+    listings matching the search are returned, each with a headline. fields
+    is "full" for whole listings or "summary" for their compact form.
+    Returns (total matching listings, JSON bytes of each listing of the
+    page, next cursor)
+    """
+    try:
+        return await get_result_async(
+            ("listings", query), lambda: _query_listings(query)
+        )
+    except (ValueError, TypeError):
+        # Invalid filter - no results (database errors are raised, so they
+        # are never cached as an empty page)
+        return 0, [], None
+
+
+async def _query_listings(
+    query: ListingQuery,
+) -> tuple[int, list[bytes], Optional[str]]:
+    q, lat, lon = query.q, query.lat, query.lon
+    sort_by, sort_order = query.sort_by, query.sort_order
+    async with AsyncSessionLocal() as db:
+        conditions = build_filters(
+            property_type=query.property_type,
+            min_price=query.min_price,
+            max_price=query.max_price,
+            min_rooms=query.min_rooms,
+            max_rooms=query.max_rooms,
+            min_bathrooms=query.min_bathrooms,
+            max_bathrooms=query.max_bathrooms,
+            max_distance=query.max_distance,
+            lat=lat,
+            lon=lon,
+            radius_km=query.radius_km,
+            q=q,
+        )
+        total = await db.scalar(
+            select(func.count()).select_from(ListingSearch).where(*conditions)
+        )
+
+        key = sort_key(sort_by, lat, lon, q)
+        statement = (
+            select(
+                ListingSearch.web_slug,
+                ListingSearch.hash,
+                distance_column(lat, lon),
+                key if key is not None else literal(None),
+            )
+            .where(*conditions)
+            .order_by(*build_order(sort_by, sort_order, lat, lon, q))
+        )
+        page_size = query.page_size
+        if query.cursor:
+            statement = statement.where(
+                cursor_condition(query.cursor, sort_by, sort_order, lat, lon, q)
+            )
+        else:
+            statement = statement.offset((query.page - 1) * page_size)
+        rows = (await db.execute(statement.limit(page_size))).all()
+
+        next_cursor = None
+        if len(rows) == page_size:
+            web_slug, _, _, value = rows[-1]
+            next_cursor = encode_cursor(value, web_slug, sort_by, sort_order)
+
+        # Only listings whose serialized form isn't cached are read
+        payloads = await load_payloads(
+            db,
+            [(web_slug, listing_hash) for web_slug, listing_hash, _, _ in rows],
+            query.fields,
+        )
         listings = [
-            listing
-            for listing in listings
-            if listing.get("distance_km") is not None
-            and listing["distance_km"] <= max_distance
+            with_distance(payloads[web_slug], distance)
+            for web_slug, _, distance, _ in rows
         ]
+        if q and rows:
+            headlines = await load_headlines(db, [web_slug for web_slug, *_ in rows], q)
+            listings = [
+                with_headline(payload, headlines.get(web_slug))
+                for (web_slug, *_), payload in zip(rows, listings)
+            ]
+        return total, listings, next_cursor
 
-    return listings
+
+async def load_listing(web_slug: str) -> Optional[dict]:
+    """A listing with all its fields and images, or None if there is none"""
+    try:
+        async with AsyncSessionLocal() as db:
+            listing = await db.get(Listing, web_slug)
+            return listing_to_dict(listing) if listing is not None else None
+    except (ValueError, TypeError, RuntimeError, Exception):
+        # Database connection error - no listing
+        return None
+
+
+def filter_listings(
+    property_type: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    min_rooms: Optional[int] = None,
+    max_rooms: Optional[int] = None,
+    min_bathrooms: Optional[int] = None,
+    max_bathrooms: Optional[int] = None,
+    max_distance: Optional[float] = None,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    radius_km: Optional[float] = None,
+) -> list[dict]:
+    """Apply filters to all listings (the columnar snapshot of this version)"""
+    columns = load_columns()
+    return columns.select(
+        columns.mask(
+            property_type=property_type,
+            min_price=min_price,
+            max_price=max_price,
+            min_rooms=min_rooms,
+            max_rooms=max_rooms,
+            min_bathrooms=min_bathrooms,
+            max_bathrooms=max_bathrooms,
+            max_distance=max_distance,
+            lat=lat,
+            lon=lon,
+            radius_km=radius_km,
+        )
+    )
 
 
 def sort_listings(
@@ -139,36 +494,6 @@ def sort_listings(
     return listings
 
 
-def get_stats(listings: list[dict]) -> dict:
-    """Calculate statistics of listings"""
-    prices = [listing["price"] for listing in listings if listing.get("price")]
-    rooms = [listing["rooms"] for listing in listings if listing.get("rooms")]
-    bathrooms = [
-        listing["bathrooms"] for listing in listings if listing.get("bathrooms")
-    ]
-    distances = [
-        listing["distance_km"] for listing in listings if listing.get("distance_km")
-    ]
-
-    return {
-        "total": len(listings),
-        "apartments": len(
-            [listing for listing in listings if listing["property_type"] == "apartment"]
-        ),
-        "houses": len(
-            [listing for listing in listings if listing["property_type"] == "house"]
-        ),
-        "price": {
-            "min": min(prices) if prices else 0,
-            "max": max(prices) if prices else 0,
-        },
-        "rooms": {"min": min(rooms) if rooms else 0, "max": max(rooms) if rooms else 0},
-        "bathrooms": {
-            "min": min(bathrooms) if bathrooms else 0,
-            "max": max(bathrooms) if bathrooms else 0,
-        },
-        "distance": {
-            "min": min(distances) if distances else 0,
-            "max": max(distances) if distances else 0,
-        },
-    }
+def get_stats() -> dict:
+    """Calculate statistics of all listings (the columnar snapshot)"""
+    return load_columns().stats()
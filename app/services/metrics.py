@@ -0,0 +1,64 @@
+"""
+Prometheus metrics of refreshes, syncs, notifications, caches and HTTP
+requests, exposed at /metrics.
+"""
+
+from prometheus_client import Counter, Histogram
+
+# Scraper
+SCRAPER_REQUEST_SECONDS = Histogram(
+    "scraper_request_seconds",
+    "Latency of Wallapop search page requests, by response status",
+    ["status"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+SCRAPER_ITEMS = Counter(
+    "scraper_items_total",
+    "Listings fetched, filtered out, new, updated and removed",
+    ["property_type", "outcome"],
+)
+REFRESH_SECONDS = Histogram(
+    "refresh_duration_seconds",
+    "Duration of refreshes, by trigger",
+    ["trigger"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+
+# Sync
+SYNC_DB_SECONDS = Histogram(
+    "sync_db_seconds",
+    "Time spent writing syncs to the database, by operation",
+    ["operation"],
+)
+
+# Telegram
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds",
+    "Latency of Telegram sendMessage requests (each attempt)",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+TELEGRAM_FAILURES = Counter(
+    "telegram_send_failures_total",
+    "Failed Telegram sendMessage attempts, by reason",
+    ["reason"],
+)
+
+# Caches
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"],
+)
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests, by method, route and status",
+    ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup"""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
@@ -0,0 +1,136 @@
+"""Maintenance of the listing_search projection used by /api/listings"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import SYNC_BATCH_SIZE
+from app.models.listing import Listing
+from app.models.listing_search import SEARCH_CONFIG, ListingSearch
+from app.services.images import thumbnail_url
+from app.services.listings import listing_to_dict
+
+# Bump when the format of projection rows changes so stored rows are rebuilt
+PAYLOAD_VERSION = 6
+
+# Characters of the description kept in summaries
+SUMMARY_DESCRIPTION_LENGTH = 160
+
+
+def epoch(value: Optional[datetime]) -> Optional[int]:
+    """Seconds since epoch of a naive UTC datetime"""
+    if value is None:
+        return None
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def search_vector(title: Optional[str], description: Optional[str]):
+    """SQL tsvector of a listing's text, title words weighing more"""
+    title_vector = func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, title or ""), literal_column("'A'")
+    )
+    description_vector = func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, description or ""), literal_column("'B'")
+    )
+    return title_vector.op("||")(description_vector)
+
+
+def summarize(item: dict) -> dict:
+    """Compact form of a serialized listing, with what list views show"""
+    description = item["description"]
+    if description and len(description) > SUMMARY_DESCRIPTION_LENGTH:
+        cut = description[:SUMMARY_DESCRIPTION_LENGTH].rsplit(" ", 1)[0]
+        description = cut.rstrip(" ,.;:") + "…"
+    return {
+        "web_slug": item["web_slug"],
+        "property_type": item["property_type"],
+        "title": item["title"],
+        "description": description,
+        "price": item["price"],
+        "reserved": item["reserved"],
+        "location": {
+            "city": item["location"]["city"],
+            "postal_code": item["location"]["postal_code"],
+        },
+        "type_attributes": {
+            "surface": item["type_attributes"]["surface"],
+            "rooms": item["type_attributes"]["rooms"],
+            "bathrooms": item["type_attributes"]["bathrooms"],
+        },
+        "thumbnail": item["thumbnail"],
+        "image_count": item["image_count"],
+        "modified_at": item["modified_at"],
+    }
+
+
+def search_row(listing: Listing) -> dict:
+    """Projection row of a listing"""
+    item = listing_to_dict(listing)
+    del item["distance_km"]
+    # Lists show one thumbnail, the full images are loaded per listing
+    images = item.pop("images")
+    item["thumbnail"] = thumbnail_url(listing.image_sizes, images)
+    item["image_count"] = len(images)
+
+    price_per_m2 = None
+    if listing.price and listing.surface:
+        price_per_m2 = round(listing.price / listing.surface, 2)
+
+    return {
+        "web_slug": listing.web_slug,
+        "property_type": listing.property_type,
+        "price": listing.price,
+        "rooms": listing.rooms,
+        "bathrooms": listing.bathrooms,
+        "surface": listing.surface,
+        "price_per_m2": price_per_m2,
+        "latitude": listing.latitude,
+        "longitude": listing.longitude,
+        "distance_km": listing.distance_km,
+        "geo_cell": listing.geo_cell,
+        "created_ts": epoch(listing.created_at),
+        "modified_ts": epoch(listing.modified_at),
+        "search_vector": search_vector(listing.title, listing.description),
+        "hash": listing.hash,
+        "payload": orjson.dumps(item).decode(),
+        "summary": orjson.dumps(summarize(item)).decode(),
+        "payload_version": PAYLOAD_VERSION,
+    }
+
+
+def refresh_projection(db, listings: list[Listing]):
+    """Insert or replace the projection rows of listings, in batches"""
+    rows = [search_row(listing) for listing in listings]
+    for start in range(0, len(rows), SYNC_BATCH_SIZE):
+        stmt = insert(ListingSearch).values(rows[start : start + SYNC_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ListingSearch.web_slug],
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in ListingSearch.__table__.columns
+                if column.name != "web_slug"
+            },
+        )
+        db.execute(stmt)
+
+
+def refresh_stale_projection(db):
+    """Project listings that are missing from the projection or out of date"""
+    while True:
+        listings = (
+            db.query(Listing)
+            .outerjoin(ListingSearch, ListingSearch.web_slug == Listing.web_slug)
+            .filter(
+                (ListingSearch.web_slug.is_(None))
+                | (ListingSearch.payload_version < PAYLOAD_VERSION)
+            )
+            .limit(SYNC_BATCH_SIZE)
+            .all()
+        )
+        if not listings:
+            break
+        refresh_projection(db, listings)
+        db.commit()
@@ -0,0 +1,236 @@
+"""
+Single-flight refresh runner and built-in periodic scheduler.
+
+Only one refresh runs at a time: a process-local lock coalesces concurrent
+triggers in a worker, and a Postgres advisory lock keeps other workers from
+refreshing at the same time. Every worker runs the scheduler, but refreshes
+are recorded in the database (refresh_state), so a worker skips a scheduled
+refresh another one has just done and times its next one after it.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.config import (
+    PROPERTY_TYPES,
+    REFRESH_INTERVALS,
+    REFRESH_JITTERS,
+    REFRESH_LOCK_KEY,
+)
+from app.db import engine
+from app.services.metrics import REFRESH_SECONDS
+from app.services.scraper import load_refresh_state, refresh_all_listings
+
+# Seconds before the scheduler checks again on a refresh that is overdue but
+# was not done (running in another worker, or failed)
+RETRY_SECONDS = 300
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def last_refreshes() -> dict[str, float]:
+    """Epoch seconds of the last refresh of each property type, by any worker"""
+    try:
+        state = load_refresh_state()
+    except (ValueError, TypeError, RuntimeError, Exception):
+        # Database connection error - no refreshes known
+        return {}
+    return {
+        property_type: times["refreshed_at"]
+        for property_type, times in state.items()
+        if times["refreshed_at"] is not None
+    }
+
+
+def is_recent(property_type: str, refreshed_at: Optional[float]) -> bool:
+    """Whether a refresh is more recent than the shortest jittered interval"""
+    if refreshed_at is None:
+        return False
+    min_interval = REFRESH_INTERVALS[property_type] * (
+        1 - REFRESH_JITTERS[property_type]
+    )
+    return time.time() - refreshed_at < min_interval
+
+
+@contextmanager
+def advisory_lock():
+    """
+    Try to take the refresh advisory lock, yielding whether it was taken. The
+    lock is held by the session, so its connection autocommits instead of
+    sitting idle in a transaction for the whole refresh.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": REFRESH_LOCK_KEY}
+        ).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": REFRESH_LOCK_KEY}
+                )
+
+
+class RefreshRunner:
+    """Runs refreshes one at a time and keeps track of their timing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self.current: Optional[dict] = None
+        self.last_run: Optional[dict] = None
+        self.next_runs: dict[str, float] = {}
+
+    @property
+    def running(self) -> bool:
+        return self.current is not None
+
+    def run(
+        self,
+        property_types: Optional[list[str]] = None,
+        full: Optional[bool] = None,
+        trigger: str = "api",
+        wait: bool = True,
+        skip_recent: bool = False,
+    ) -> dict:
+        """
+        Refresh listings unless a refresh is already running. If one is,
+        wait for it and return its result (or return at once if not wait).
+        With skip_recent, property types recently refreshed by any worker
+        are left out.
+        """
+        with self._lock:
+            if self.current is not None:
+                if not wait:
+                    return {"success": False, "message": "Refresh already running"}
+                current = self.current
+                while self.current is current:
+                    self._finished.wait()
+                return self.last_run["result"]
+
+            self.current = {
+                "trigger": trigger,
+                "property_types": property_types or PROPERTY_TYPES,
+                "started_at": time.time(),
+            }
+
+        result = None
+        try:
+            with advisory_lock() as acquired:
+                if acquired and skip_recent:
+                    # Checked under the lock, after any refresh it waited for
+                    refreshed = last_refreshes()
+                    property_types = [
+                        property_type
+                        for property_type in property_types or PROPERTY_TYPES
+                        if not is_recent(property_type, refreshed.get(property_type))
+                    ]
+                if not acquired:
+                    result = {
+                        "success": False,
+                        "message": "Refresh running in another worker",
+                    }
+                elif skip_recent and not property_types:
+                    result = {
+                        "success": True,
+                        "message": "Refreshed recently by another worker",
+                    }
+                else:
+                    with REFRESH_SECONDS.labels(trigger=trigger).time():
+                        result = refresh_all_listings(property_types, full=full)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        finally:
+            with self._lock:
+                self.last_run = {
+                    **self.current,
+                    "finished_at": time.time(),
+                    "result": result,
+                }
+                self.current = None
+                self._finished.notify_all()
+
+        return result
+
+    def status(self) -> dict:
+        """Current, last and next refreshes"""
+        current = self.current
+        last_run = self.last_run
+        return {
+            "running": current is not None,
+            "current": current
+            and {**current, "started_at": _isoformat(current["started_at"])},
+            "last_run": last_run
+            and {
+                "trigger": last_run["trigger"],
+                "property_types": last_run["property_types"],
+                "started_at": _isoformat(last_run["started_at"]),
+                "finished_at": _isoformat(last_run["finished_at"]),
+                "duration_seconds": round(
+                    last_run["finished_at"] - last_run["started_at"], 2
+                ),
+                "success": bool(last_run["result"].get("success")),
+            },
+            "next_runs": {
+                property_type: _isoformat(next_run)
+                for property_type, next_run in self.next_runs.items()
+            },
+        }
+
+
+runner = RefreshRunner()
+
+
+def _next_run(property_type: str, refreshed_at: Optional[float]) -> float:
+    """An interval (with jitter) after the last refresh, or after now"""
+    jitter = REFRESH_JITTERS[property_type]
+    interval = REFRESH_INTERVALS[property_type] * (
+        1 + random.uniform(-jitter, jitter)
+    )
+    if refreshed_at is None:
+        return time.time() + interval
+    return refreshed_at + interval
+
+
+async def _schedule(property_types: list[str], delay: float = 0):
+    """Time the next refresh of property_types, at least delay seconds away"""
+    refreshed = await asyncio.to_thread(last_refreshes)
+    earliest = time.time() + delay
+    for property_type in property_types:
+        runner.next_runs[property_type] = max(
+            _next_run(property_type, refreshed.get(property_type)), earliest
+        )
+
+
+async def run_scheduler():
+    """Refresh each property type periodically (runs until cancelled)"""
+    await _schedule(PROPERTY_TYPES)
+
+    while True:
+        await asyncio.sleep(max(0, min(runner.next_runs.values()) - time.time()))
+
+        now = time.time()
+        due = [
+            property_type
+            for property_type, next_run in runner.next_runs.items()
+            if next_run <= now
+        ]
+        if not due:
+            continue
+
+        await asyncio.to_thread(
+            runner.run, due, trigger="scheduler", skip_recent=True
+        )
+        await _schedule(due, RETRY_SECONDS)
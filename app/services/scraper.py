@@ -1,25 +1,45 @@
+import asyncio
 import time
 from datetime import datetime
+from typing import AsyncIterator, Optional
 
 import httpx
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 
 from app.config import (
     BASE_PARAMS,
+    FULL_SWEEP_INTERVAL,
+    INCREMENTAL_ORDER_BY,
     MIN_PRICE,
+    PRICE_SHARDS,
     PROPERTY_TYPES,
-    TEMPORARY_RENTAL_KEYWORDS,
+    SCRAPER_BACKOFF_BASE,
+    SCRAPER_BACKOFF_MAX,
+    SCRAPER_CONCURRENCY,
+    SCRAPER_MAX_RETRIES,
+    SCRAPER_RATE,
+)
+from app.constants.wallapop import HEADERS, SEARCH_URL
+from app.db import SessionLocal, engine
+from app.models.listing import Listing, PropertyType
+from app.models.refresh import RefreshState
+from app.services.classifier import temporary_rental_matcher
+from app.services.metrics import SCRAPER_ITEMS, SCRAPER_REQUEST_SECONDS
+from app.services.projection import epoch
+from app.services.ratelimit import TokenBucket, backoff_delay, parse_retry_after
+from app.services.sync import (
+    publish_changes,
+    remove_missing,
+    stored_hashes,
+    upsert_listings,
 )
-from app.constants.wallapop import HEADERS
-from app.db import SessionLocal, init_db
-from app.services.sync import sync_listings
 
 
 def is_temporary_rental(item: dict) -> bool:
     """Check if listing is a temporary rental"""
-    title = item.get("title", "").lower()
-    description = item.get("description", "").lower()
-    text = f"{title} {description}"
-    return any(keyword in text for keyword in TEMPORARY_RENTAL_KEYWORDS)
+    text = f"{item.get('title', '')} {item.get('description', '')}"
+    return temporary_rental_matcher.match(text) is not None
 
 
 def simplify_items(items: list[dict]) -> list[dict]:
@@ -40,7 +60,14 @@ def simplify_items(items: list[dict]) -> list[dict]:
         if "price" in item and isinstance(item["price"], dict):
             item["price"] = item["price"].get("amount", 0)
 
-        item["images"] = [img["urls"]["big"] for img in item.get("images", [])]
+        # The big size is the full image, the other sizes are kept for
+        # thumbnails
+        urls = [img["urls"] for img in item.get("images", [])]
+        item["images"] = [sizes["big"] for sizes in urls]
+        item["image_sizes"] = [
+            {size: url for size, url in sizes.items() if size != "big"}
+            for sizes in urls
+        ]
 
         if "created_at" in item:
             item["created_at"] = datetime.fromtimestamp(
@@ -54,118 +81,410 @@ def simplify_items(items: list[dict]) -> list[dict]:
     return items
 
 
-def fetch_all_pages(
-    params_base: dict, headers: dict, max_pages: int = 10
-) -> list[dict]:
-    """Get all paginated results from API"""
-    all_items = []
-    params = params_base.copy()
-    page = 1
-
-    with httpx.Client(headers=headers) as client:
-        while page <= max_pages:
-            print(f"  Page {page}...", end=" ")
-            response = client.get(
-                "https://api.wallapop.com/api/v3/search", params=params
+async def fetch_page(
+    client: httpx.AsyncClient, params: dict, limiter: TokenBucket, label: str
+) -> Optional[dict]:
+    """Get one page from the API, retrying on 429/5xx and network errors"""
+    for attempt in range(SCRAPER_MAX_RETRIES + 1):
+        await limiter.acquire()
+        retry_after = None
+        start = time.perf_counter()
+        try:
+            response = await client.get(SEARCH_URL, params=params)
+        except httpx.TransportError as e:
+            error = type(e).__name__
+            SCRAPER_REQUEST_SECONDS.labels(status="error").observe(
+                time.perf_counter() - start
             )
+        else:
+            SCRAPER_REQUEST_SECONDS.labels(status=response.status_code).observe(
+                time.perf_counter() - start
+            )
+            if response.status_code == 200:
+                limiter.speed_up()
+                return response.json()
+            error = f"Error {response.status_code}"
+            if response.status_code != 429 and response.status_code < 500:
+                print(f"  [{label}] {error}")
+                return None
+            if response.status_code == 429:
+                limiter.slow_down()
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                # A server asking for minutes (or days) must not stall the shard
+                retry_after = min(retry_after, SCRAPER_BACKOFF_MAX)
+
+        if attempt == SCRAPER_MAX_RETRIES:
+            print(f"  [{label}] {error}, giving up")
+            break
+
+        if retry_after is None:
+            retry_after = backoff_delay(
+                attempt, SCRAPER_BACKOFF_BASE, SCRAPER_BACKOFF_MAX
+            )
+        print(f"  [{label}] {error}, retrying in {retry_after:.1f}s")
+        await asyncio.sleep(retry_after)
 
-            if response.status_code != 200:
-                print(f"Error {response.status_code}")
-                break
+    return None
 
-            data = response.json()
-            items = data["data"]["section"]["payload"]["items"]
 
-            if not items:
-                print("No more results")
-                break
+class FetchError(Exception):
+    """A page of results could not be fetched"""
 
-            all_items.extend(items)
-            print(f"{len(items)} items (total: {len(all_items)})")
 
-            next_page = data.get("meta", {}).get("next_page")
-            if not next_page:
-                break
+async def iter_pages(
+    client: httpx.AsyncClient,
+    params_base: dict,
+    limiter: TokenBucket,
+    label: str,
+    max_pages: int = 10,
+) -> AsyncIterator[list[dict]]:
+    """
+    Yield the items of each page of results as soon as it arrives.
+    Raises FetchError if a page fails
+    """
+    params = params_base.copy()
 
-            params = {"next_page": next_page}
-            page += 1
+    for page in range(1, max_pages + 1):
+        data = await fetch_page(client, params, limiter, f"{label} page {page}")
+        if data is None:
+            raise FetchError(f"{label} page {page}")
 
-    return all_items
+        items = data["data"]["section"]["payload"]["items"]
 
+        if not items:
+            print(f"  [{label}] Page {page}: No more results")
+            return
 
-def process_property_type(property_type: str, headers: dict, db) -> dict:
-    """Process property type and save results"""
-    print(f"\n{'=' * 60}")
-    print(f"Processing {property_type}s...")
-    print(f"{'=' * 60}")
+        print(f"  [{label}] Page {page}: {len(items)} items")
+        yield items
+
+        next_page = data.get("meta", {}).get("next_page")
+        if not next_page:
+            return
 
+        params = {"next_page": next_page}
+
+
+def search_shards(
+    property_type: str, order_by: Optional[str] = None
+) -> list[tuple[str, dict]]:
+    """Search parameters for each price band of a property type, with labels"""
     params = {**BASE_PARAMS, "type": property_type}
-    items = fetch_all_pages(params, headers, max_pages=10)
+    if order_by:
+        params["order_by"] = order_by
+    if not PRICE_SHARDS:
+        return [(property_type, params)]
+
+    shards = []
+    for min_price, max_price in PRICE_SHARDS:
+        shard = {**params, "min_sale_price": str(min_price)}
+        if max_price is not None:
+            shard["max_sale_price"] = str(max_price)
+        shards.append((f"{property_type} {min_price}-{max_price or ''}", shard))
+    return shards
+
+
+class PropertyTypeSync:
+    """
+    Streams the pages of a property type into the database as they arrive.
+    Each page is prepared and upserted on its own (in a worker thread, so
+    writes overlap fetching other pages) and only the slugs seen are kept,
+    to remove missing listings at the end of a complete full sweep.
+    Incremental refreshes (full False) compare pages with the stored hashes.
+    """
+
+    def __init__(self, property_type: str, full: bool):
+        self.property_type = property_type
+        self.full = full
+        self.db = SessionLocal()
+        self.stored = None if full else stored_hashes(self.db, property_type)
+        self.seen: set[str] = set()
+        self.filtered_temp = 0
+        self.filtered_price = 0
+        self.new = 0
+        self.updated = 0
+        # Whether changes were committed but not published to the caches yet
+        self.unpublished = False
+        # The session is used by one worker thread at a time
+        self._lock = asyncio.Lock()
+
+    async def add(self, items: list[dict]) -> bool:
+        """
+        Prepare and save a page of raw items. Returns whether the page holds
+        nothing new or changed (on incremental refreshes)
+        """
+        self.count("fetched", len(items))
+        items, filtered_temp, filtered_price = prepare_items(items)
+        self.filtered_temp += filtered_temp
+        self.filtered_price += filtered_price
+        self.count("filtered_temporary", filtered_temp)
+        self.count("filtered_price", filtered_price)
+        rows = [Listing.row_from_dict(item, self.property_type) for item in items]
+        known = self.stored is not None and is_known_page(rows, self.stored)
+
+        # Price bands may overlap at their boundaries
+        fresh = [
+            (item, row)
+            for item, row in zip(items, rows)
+            if row["web_slug"] not in self.seen
+        ]
+        self.seen.update(row["web_slug"] for _, row in fresh)
+        if not fresh:
+            return known
+
+        async with self._lock:
+            changes = await asyncio.to_thread(
+                upsert_listings,
+                self.db,
+                self.property_type,
+                [item for item, _ in fresh],
+                [row for _, row in fresh],
+            )
 
+        self.new += len(changes["new"])
+        self.updated += len(changes["updated"])
+        if changes["new"] or changes["updated"]:
+            self.unpublished = True
+        self.count("new", len(changes["new"]))
+        self.count("updated", len(changes["updated"]))
+        for mark, changed in (("+", changes["new"]), ("~", changes["updated"])):
+            for item in changed:
+                print(
+                    f"  [{self.property_type}] {mark} "
+                    f"{item.get('title', '?')[:50]} - {item.get('price', '?')}€"
+                )
+        return known
+
+    async def finish(self, complete: bool) -> dict:
+        """
+        Remove missing listings after a complete full sweep, publish the
+        changes to the caches (once for the whole property type) and
+        summarize.
+        """
+        removed = []
+        async with self._lock:
+            if complete and self.full:
+                removed = await asyncio.to_thread(
+                    remove_missing, self.db, self.property_type, self.seen
+                )
+            if removed or self.unpublished:
+                await asyncio.to_thread(publish_changes, self.db)
+                self.unpublished = False
+        self.count("removed", len(removed))
+        for slug in removed:
+            print(f"  [{self.property_type}] - {slug}")
+
+        print(f"\n{'=' * 60}")
+        print(
+            f"{self.property_type}s ({'full' if self.full else 'incremental'}): "
+            f"{len(self.seen)} listings, {self.new} new, {self.updated} updated, "
+            f"{len(removed)} removed"
+        )
+        if not complete:
+            print("  Incomplete fetch, kept listings not seen in this run")
+        if self.filtered_temp > 0:
+            print(f"  Filtered out {self.filtered_temp} temporary rental(s)")
+        if self.filtered_price > 0:
+            print(f"  Filtered out {self.filtered_price} item(s) below {MIN_PRICE}E")
+        print(f"{'=' * 60}")
+
+        return {
+            "property_type": self.property_type,
+            "full": self.full,
+            "complete": complete,
+            "total": len(self.seen),
+            "filtered_temporary": self.filtered_temp,
+            "filtered_price": self.filtered_price,
+            "new": self.new,
+            "updated": self.updated,
+            "removed": len(removed),
+        }
+
+    def count(self, outcome: str, amount: int):
+        """Add to the scraper_items_total metric of this property type"""
+        SCRAPER_ITEMS.labels(property_type=self.property_type, outcome=outcome).inc(
+            amount
+        )
+
+    def close(self):
+        # Changes of a refresh that failed before finishing are still shown
+        if self.unpublished:
+            try:
+                publish_changes(self.db)
+            except Exception as e:
+                print(f"  [{self.property_type}] Publishing changes failed: {e}")
+        self.db.close()
+
+
+async def sync_shard(
+    client: httpx.AsyncClient,
+    label: str,
+    params: dict,
+    semaphore: asyncio.Semaphore,
+    limiter: TokenBucket,
+    sink: PropertyTypeSync,
+) -> bool:
+    """
+    Stream the pages of a shard into sink, stopping early on incremental
+    refreshes once a page holds nothing new or changed.
+    Returns False if a page failed
+    """
+    async with semaphore:
+        try:
+            async for items in iter_pages(client, params, limiter, label):
+                if await sink.add(items):
+                    print(f"  [{label}] Nothing new, stopping")
+                    break
+        except FetchError:
+            return False
+    return True
+
+
+async def sync_property_type(
+    client: httpx.AsyncClient,
+    sink: PropertyTypeSync,
+    semaphore: asyncio.Semaphore,
+    limiter: TokenBucket,
+) -> dict:
+    """Sync all shards of a property type concurrently"""
+    order_by = None if sink.full else INCREMENTAL_ORDER_BY
+    results = await asyncio.gather(
+        *[
+            sync_shard(client, label, params, semaphore, limiter, sink)
+            for label, params in search_shards(sink.property_type, order_by)
+        ]
+    )
+    return await sink.finish(all(results))
+
+
+async def sync_all_property_types(
+    headers: dict, sinks: list[PropertyTypeSync]
+) -> list[dict]:
+    """Sync property types concurrently over a shared connection pool"""
+    semaphore = asyncio.Semaphore(SCRAPER_CONCURRENCY)
+    limiter = TokenBucket(SCRAPER_RATE)
+    limits = httpx.Limits(max_connections=SCRAPER_CONCURRENCY)
+
+    async with httpx.AsyncClient(headers=headers, limits=limits) as client:
+        return await asyncio.gather(
+            *[sync_property_type(client, sink, semaphore, limiter) for sink in sinks]
+        )
+
+
+def prepare_items(items: list[dict]) -> tuple[list[dict], int, int]:
+    """
+    Drop temporary rentals, simplify items and drop those below MIN_PRICE.
+    Returns (items, filtered temporary rentals, filtered by price)
+    """
     original_count = len(items)
     items = [item for item in items if not is_temporary_rental(item)]
     filtered_temp = original_count - len(items)
 
-    if filtered_temp > 0:
-        print(f"  Filtered out {filtered_temp} temporary rental(s)")
-
     items = simplify_items(items)
 
     original_count = len(items)
     items = [item for item in items if item.get("price", 0) >= MIN_PRICE]
     filtered_price = original_count - len(items)
 
-    if filtered_price > 0:
-        print(f"  Filtered out {filtered_price} item(s) below {MIN_PRICE}E")
+    return items, filtered_temp, filtered_price
 
-    # Sync with DB and get changes
-    changes = sync_listings(db, property_type, items)
 
-    # Print new listings
-    if changes["new"]:
-        print(f"\n  NEW ({len(changes['new'])}):")
-        for item in changes["new"]:
-            print(f"    + {item.get('title', '?')[:50]} - {item.get('price', '?')}€")
+def is_known_page(rows: list[dict], stored: dict[str, int]) -> bool:
+    """
+    Whether a page of Listing rows has listings to keep and all are stored
+    and unchanged
+    """
+    return bool(rows) and all(
+        stored.get(row["web_slug"]) == row["hash"] for row in rows
+    )
 
-    # Print updated listings
-    if changes["updated"]:
-        print(f"\n  UPDATED ({len(changes['updated'])}):")
-        for item in changes["updated"]:
-            print(f"    ~ {item.get('title', '?')[:50]} - {item.get('price', '?')}€")
 
-    # Print removed listings
-    if changes["removed"]:
-        print(f"\n  REMOVED ({len(changes['removed'])}):")
-        for slug in changes["removed"]:
-            print(f"    - {slug}")
+def needs_full_sweep(last_sweep: Optional[float]) -> bool:
+    """Whether the last complete full sweep (epoch seconds) is too old"""
+    return last_sweep is None or time.time() - last_sweep >= FULL_SWEEP_INTERVAL
 
-    if not changes["new"] and not changes["updated"] and not changes["removed"]:
-        print("\n  No changes")
 
-    return {
-        "property_type": property_type,
-        "total": len(items),
-        "filtered_temporary": filtered_temp,
-        "filtered_price": filtered_price,
-        "new": len(changes["new"]),
-        "updated": len(changes["updated"]),
-        "removed": len(changes["removed"]),
-    }
+def load_refresh_state() -> dict[str, dict]:
+    """
+    Last refresh and start of the last complete full sweep of each property
+    type, in epoch seconds
+    """
+    db = SessionLocal()
+    try:
+        return {
+            state.property_type.value: {
+                "refreshed_at": epoch(state.refreshed_at),
+                "full_sweep_at": epoch(state.full_sweep_at),
+            }
+            for state in db.query(RefreshState).all()
+        }
+    finally:
+        db.close()
 
 
-def refresh_all_listings() -> dict:
-    """Update all listings from Wallapop"""
-    init_db()
+def save_refresh_state(results: list[dict], started_at: float):
+    """Record the refresh of each property type in results, for all workers"""
+    if not results:
+        return
+    refreshed_at = datetime.utcnow()
+    swept_at = datetime.utcfromtimestamp(started_at)
+    stmt = insert(RefreshState).values(
+        [
+            {
+                "property_type": PropertyType(result["property_type"]),
+                "refreshed_at": refreshed_at,
+                "full_sweep_at": swept_at
+                if result["complete"] and result["full"]
+                else None,
+            }
+            for result in results
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RefreshState.property_type],
+        set_={
+            "refreshed_at": stmt.excluded.refreshed_at,
+            "full_sweep_at": func.coalesce(
+                stmt.excluded.full_sweep_at, RefreshState.full_sweep_at
+            ),
+        },
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt)
+
+
+def refresh_all_listings(
+    property_types: Optional[list[str]] = None, full: Optional[bool] = None
+) -> dict:
+    """
+    Update listings of property_types (all by default) from Wallapop.
+    full forces a full sweep (True) or an incremental refresh (False); by
+    default each property type gets a full sweep every FULL_SWEEP_INTERVAL.
+    The schema is set up by the app's startup (init_db), not per refresh.
+    """
     overall_start = time.time()
-    results = []
+    property_types = property_types or PROPERTY_TYPES
+    state = load_refresh_state()
 
-    db = SessionLocal()
+    sinks = []
     try:
-        for property_type in PROPERTY_TYPES:
-            result = process_property_type(property_type, HEADERS, db)
-            results.append(result)
+        for property_type in property_types:
+            last_sweep = state.get(property_type, {}).get("full_sweep_at")
+            sinks.append(
+                PropertyTypeSync(
+                    property_type,
+                    needs_full_sweep(last_sweep) if full is None else full,
+                )
+            )
+
+        print("Fetching listings...")
+        results = asyncio.run(sync_all_property_types(HEADERS, sinks))
     finally:
-        db.close()
+        for sink in sinks:
+            sink.close()
+
+    save_refresh_state(results, overall_start)
 
     total_time = time.time() - overall_start
     print(f"\n{'=' * 60}")
@@ -1,61 +1,156 @@
-from app.config import NOTIFICATION_MAX_PRICE
+from typing import Optional
+
+from sqlalchemy import String, all_, delete, literal, literal_column
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from app.config import NOTIFICATION_MAX_PRICE, SYNC_BATCH_SIZE
 from app.models.listing import Listing, PropertyType
-from app.services.telegram import send_listing_notification
+from app.services.cache import set_data_version
+from app.services.changes import notify_change
+from app.services.history import add_history
+from app.services.metrics import SYNC_DB_SECONDS
+from app.services.projection import refresh_projection
+from app.services.telegram import add_to_outbox, dispatcher
 
 
-def sync_listings(db, property_type: str, items: list[dict]) -> dict:
-    """
-    Sync listings with database.
-    Returns {new: [...], removed: [...], updated: [...]}
-    """
-    # Get current listings from database
-    stored = {
+def stored_hashes(db, property_type: str) -> dict[str, int]:
+    """Hashes of the stored listings of a property type, by web_slug"""
+    return {
         listing.web_slug: listing.hash
         for listing in db.query(Listing.web_slug, Listing.hash)
         .filter(Listing.property_type == PropertyType(property_type))
         .all()
     }
 
-    current_slugs = set()
-    new_items = []
-    updated_items = []
-
-    for item in items:
-        slug = item.get("web_slug")
-        if not slug:
-            continue
-
-        current_slugs.add(slug)
-        item_hash = Listing.compute_hash(item)
-
-        if slug not in stored:
-            new_items.append(item)
-            db.add(Listing.from_dict(item, property_type))
-        elif stored[slug] != item_hash:
-            updated_items.append(item)
-            db.query(Listing).filter(Listing.web_slug == slug).delete()
-            db.add(Listing.from_dict(item, property_type))
-
-    # Removed
-    stored_slugs = set(stored.keys())
-    removed_slugs = stored_slugs - current_slugs
-
-    if removed_slugs:
-        db.query(Listing).filter(
-            Listing.web_slug.in_(removed_slugs),
+
+def backfill_hashes(db):
+    """Hash listings stored before hashes covered only persisted fields"""
+    columns = [column.name for column in Listing.__table__.columns]
+    while True:
+        listings = (
+            db.query(Listing).filter(Listing.hash == 0).limit(SYNC_BATCH_SIZE).all()
+        )
+        if not listings:
+            break
+        for listing in listings:
+            listing.hash = Listing.compute_hash(
+                {column: getattr(listing, column) for column in columns}
+            )
+        db.commit()
+
+
+def upsert_rows(db, rows: list[dict]) -> tuple[list[str], list[str]]:
+    """
+    Insert new listings and update changed ones in batches.
+    Rows whose hash is unchanged are left untouched.
+    Returns (new slugs, updated slugs)
+    """
+    new_slugs = []
+    updated_slugs = []
+
+    for start in range(0, len(rows), SYNC_BATCH_SIZE):
+        stmt = insert(Listing).values(rows[start : start + SYNC_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Listing.web_slug],
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in Listing.__table__.columns
+                if column.name != "web_slug"
+            },
+            where=Listing.hash != stmt.excluded.hash,
+        ).returning(
+            # xmax is 0 for freshly inserted rows
+            Listing.web_slug,
+            literal_column("xmax = 0").label("inserted"),
+        )
+        for slug, inserted in db.execute(stmt):
+            (new_slugs if inserted else updated_slugs).append(slug)
+
+    return new_slugs, updated_slugs
+
+
+def delete_missing(db, property_type: str, current_slugs: list[str]) -> list[str]:
+    """Delete listings of a property type not in current_slugs, returning their slugs"""
+    stmt = (
+        delete(Listing)
+        .where(
             Listing.property_type == PropertyType(property_type),
-        ).delete(synchronize_session=False)
+            Listing.web_slug != all_(literal(current_slugs, ARRAY(String))),
+        )
+        .returning(Listing.web_slug)
+    )
+    return list(db.execute(stmt).scalars())
+
+
+@SYNC_DB_SECONDS.labels(operation="upsert").time()
+def upsert_listings(
+    db, property_type: str, items: list[dict], rows: Optional[list[dict]] = None
+) -> dict:
+    """
+    Save a batch of listings and commit it with its projection rows, history
+    and notifications. rows are the Listing rows of items, if already built.
+    Caches see the changes once the caller publishes them (publish_changes).
+    Returns {new: [...], updated: [...]}
+    """
+    if rows is None:
+        rows = [Listing.row_from_dict(item, property_type) for item in items]
+
+    # One row per slug (the last one wins if the API repeats a listing)
+    items_by_slug = {}
+    rows_by_slug = {}
+    for item, row in zip(items, rows):
+        if row["web_slug"]:
+            items_by_slug[row["web_slug"]] = item
+            rows_by_slug[row["web_slug"]] = row
+    rows = list(rows_by_slug.values())
+
+    new_slugs, updated_slugs = upsert_rows(db, rows)
+
+    # Keep the search projection and the history in step
+    changed = set(new_slugs) | set(updated_slugs)
+    changed_rows = [row for row in rows if row["web_slug"] in changed]
+    refresh_projection(db, [Listing(**row) for row in changed_rows])
+    add_history(db, changed_rows)
+
+    new_items = [items_by_slug[slug] for slug in new_slugs]
+    updated_items = [items_by_slug[slug] for slug in updated_slugs]
+
+    # Telegram notifications for new listings under max price are committed
+    # with the listings and delivered in the background
+    add_to_outbox(
+        db,
+        [
+            item
+            for item in new_items
+            if item.get("price", 0) and item["price"] <= NOTIFICATION_MAX_PRICE
+        ],
+    )
 
     db.commit()
+    if new_items:
+        dispatcher.wake()
 
-    # Send Telegram notifications for new listings under max price
-    for item in new_items:
-        price = item.get("price", 0)
-        if price and price <= NOTIFICATION_MAX_PRICE:
-            send_listing_notification(item)
+    return {"new": new_items, "updated": updated_items}
 
-    return {
-        "new": new_items,
-        "removed": list(removed_slugs),
-        "updated": updated_items,
-    }
+
+@SYNC_DB_SECONDS.labels(operation="remove").time()
+def remove_missing(db, property_type: str, current_slugs: set[str]) -> list[str]:
+    """
+    Remove stored listings of a property type not in current_slugs (their
+    projection rows cascade), to be published like upserts. Returns the
+    removed slugs
+    """
+    removed_slugs = delete_missing(db, property_type, list(current_slugs))
+    db.commit()
+    return removed_slugs
+
+
+def publish_changes(db):
+    """
+    Bump the data version for committed changes, so every process drops its
+    caches. Called once per synced property type rather than per batch, so
+    a refresh doesn't clear the caches page after page.
+    """
+    version = notify_change(db)
+    db.commit()
+    set_data_version(version)
@@ -1,8 +1,33 @@
+import asyncio
+import html
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import quote
+
 import httpx
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.postgresql import insert
 
-from app.config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+from app.config import (
+    TELEGRAM_API_URL,
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_CHAT_ID,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_DIGEST_SIZE,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_MAX_RETRIES,
+    TELEGRAM_MESSAGE_MAX_LENGTH,
+    TELEGRAM_OUTBOX_LEASE,
+    TELEGRAM_OUTBOX_MAX_ATTEMPTS,
+    TELEGRAM_OUTBOX_POLL,
+)
+from app.db import SessionLocal
+from app.models.outbox import OutboxNotification
+from app.services.metrics import TELEGRAM_FAILURES, TELEGRAM_SEND_SECONDS
+from app.services.ratelimit import TokenBucket, backoff_delay
 
-BASE_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+BASE_URL = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}"
 
 
 def send_message(text: str, parse_mode: str = "HTML") -> bool:
@@ -21,18 +46,59 @@ def send_message(text: str, parse_mode: str = "HTML") -> bool:
         return False
 
 
-def send_listing_notification(item: dict) -> bool:
-    """Send notification for a new listing"""
-    title = item.get("title", "Sin título")
-    price = item.get("price", "?")
-    city = item.get("location", {}).get("city", "")
-    rooms = item.get("type_attributes", {}).get("rooms", "?")
-    surface = item.get("type_attributes", {}).get("surface", "?")
+async def send_message_async(
+    client: httpx.AsyncClient, text: str, parse_mode: str = "HTML"
+) -> bool:
+    """Send message to Telegram channel, retrying on 429 (after retry_after) and 5xx"""
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            with TELEGRAM_SEND_SECONDS.time():
+                response = await client.post(
+                    f"{BASE_URL}/sendMessage",
+                    json={
+                        "chat_id": TELEGRAM_CHAT_ID,
+                        "text": text,
+                        "parse_mode": parse_mode,
+                    },
+                )
+        except httpx.TransportError as e:
+            TELEGRAM_FAILURES.labels(reason=type(e).__name__).inc()
+        else:
+            if response.status_code == 200:
+                return True
+            TELEGRAM_FAILURES.labels(reason=response.status_code).inc()
+            if response.status_code == 429:
+                try:
+                    retry_after = response.json()["parameters"]["retry_after"]
+                except (ValueError, KeyError, TypeError):
+                    pass
+            elif response.status_code < 500:
+                return False
+
+        if attempt < TELEGRAM_MAX_RETRIES:
+            if retry_after is None:
+                retry_after = backoff_delay(attempt, 1.0, 30.0)
+            await asyncio.sleep(retry_after)
+
+    return False
+
+
+def format_listing(item: dict) -> str:
+    """Format a listing as an HTML message fragment (its fields escaped)"""
+
+    def escape(value) -> str:
+        return html.escape(str(value))
+
+    title = escape(item.get("title", "Sin título"))
+    price = escape(item.get("price", "?"))
+    city = escape(item.get("location", {}).get("city", ""))
+    rooms = escape(item.get("type_attributes", {}).get("rooms", "?"))
+    surface = escape(item.get("type_attributes", {}).get("surface", "?"))
     slug = item.get("web_slug", "")
-    url = f"https://es.wallapop.com/item/{slug}"
+    url = escape(f"https://es.wallapop.com/item/{quote(slug)}")
 
-    message = (
-        f"🏠 <b>New listing!</b>\n\n"
+    return (
         f"<b>{title}</b>\n"
         f"💰 {price}€\n"
         f"📍 {city}\n"
@@ -40,7 +106,206 @@ def send_listing_notification(item: dict) -> bool:
         f'<a href="{url}">View on Wallapop</a>'
     )
 
-    return send_message(message)
+
+def format_notification(items: list[dict]) -> str:
+    """Format one or several new listings as a single message"""
+    if len(items) == 1:
+        return f"🏠 <b>New listing!</b>\n\n{format_listing(items[0])}"
+    listings = "\n\n".join(format_listing(item) for item in items)
+    return f"🏠 <b>{len(items)} new listings!</b>\n\n{listings}"
+
+
+def digest_size(items: list[dict]) -> int:
+    """
+    How many of items (at least one) fit in one message of at most
+    TELEGRAM_MESSAGE_MAX_LENGTH characters
+    """
+    count = 1
+    while (
+        count < len(items)
+        and len(format_notification(items[: count + 1]))
+        <= TELEGRAM_MESSAGE_MAX_LENGTH
+    ):
+        count += 1
+    return count
+
+
+def send_listing_notification(item: dict) -> bool:
+    """Send notification for a new listing"""
+    return send_message(format_notification([item]))
+
+
+def add_to_outbox(db, items: list[dict]):
+    """Record notifications for new listings in the caller's transaction"""
+    if not items:
+        return
+    stmt = insert(OutboxNotification).values(
+        [{"web_slug": item["web_slug"], "payload": item} for item in items]
+    )
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["web_slug"]))
+
+
+def claim_pending(db, limit: int) -> tuple[datetime, list[tuple[str, dict]]]:
+    """
+    Lease the oldest pending notifications not leased by another worker,
+    committing so no lock is held while sending. Returns the lease time and
+    the (web_slug, payload) of the claimed notifications.
+    """
+    claimed_at = datetime.utcnow()
+    expired = claimed_at - timedelta(seconds=TELEGRAM_OUTBOX_LEASE)
+    pending = (
+        select(OutboxNotification.web_slug)
+        .where(
+            OutboxNotification.sent_at.is_(None),
+            OutboxNotification.attempts < TELEGRAM_OUTBOX_MAX_ATTEMPTS,
+            or_(
+                OutboxNotification.claimed_at.is_(None),
+                OutboxNotification.claimed_at < expired,
+            ),
+        )
+        .order_by(OutboxNotification.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(OutboxNotification)
+        .where(OutboxNotification.web_slug.in_(pending.scalar_subquery()))
+        .values(claimed_at=claimed_at)
+        .returning(
+            OutboxNotification.web_slug,
+            OutboxNotification.payload,
+            OutboxNotification.created_at,
+        )
+    ).all()
+    db.commit()
+    rows.sort(key=lambda row: row.created_at)
+    return claimed_at, [(row.web_slug, row.payload) for row in rows]
+
+
+def finish_claimed(db, slugs: list[str], claimed_at: datetime, sent: bool):
+    """Record the outcome of sending leased notifications and release them"""
+    values = (
+        {"sent_at": datetime.utcnow()}
+        if sent
+        else {"attempts": OutboxNotification.attempts + 1}
+    )
+    db.execute(
+        update(OutboxNotification)
+        .where(
+            OutboxNotification.web_slug.in_(slugs),
+            # Unless the lease expired and another worker claimed them
+            OutboxNotification.claimed_at == claimed_at,
+        )
+        .values(claimed_at=None, **values)
+    )
+    db.commit()
+
+
+def release_claimed(db, slugs: list[str], claimed_at: datetime):
+    """Release leased notifications left unsent, for the next message"""
+    db.execute(
+        update(OutboxNotification)
+        .where(
+            OutboxNotification.web_slug.in_(slugs),
+            OutboxNotification.claimed_at == claimed_at,
+        )
+        .values(claimed_at=None)
+    )
+    db.commit()
+
+
+class NotificationDispatcher:
+    """
+    Delivers the notification outbox from a background thread with its own
+    event loop and a persistent HTTP client, so syncs never wait on
+    Telegram. Messages respect Telegram's per-chat and global rate limits
+    and, when TELEGRAM_DIGEST_SIZE > 1, group several listings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the worker thread if it isn't running"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._loop = asyncio.new_event_loop()
+            self._wake = asyncio.Event()
+            self._thread = threading.Thread(
+                target=self._loop.run_until_complete,
+                args=(self._worker(),),
+                name="telegram-dispatcher",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        """Deliver pending notifications and stop the worker thread"""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._loop.call_soon_threadsafe(self._wake.set)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Check the outbox now (e.g. right after a sync committed)"""
+        self.start()
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _deliver(self, client, chat_limiter, global_limiter) -> bool:
+        """Send one batch from the outbox. Returns False when nothing is pending"""
+        db = SessionLocal()
+        try:
+            claimed_at, pending = claim_pending(db, TELEGRAM_DIGEST_SIZE)
+            if not pending:
+                return False
+            count = digest_size([payload for _, payload in pending])
+            if count < len(pending):
+                # Those that don't fit go in the next message
+                release_claimed(db, [slug for slug, _ in pending[count:]], claimed_at)
+                pending = pending[:count]
+
+            # No transaction is open while waiting on the limiters and retries
+            await chat_limiter.acquire()
+            await global_limiter.acquire()
+            message = format_notification([payload for _, payload in pending])
+            sent = await send_message_async(client, message)
+
+            finish_claimed(db, [slug for slug, _ in pending], claimed_at, sent)
+            return True
+        finally:
+            db.close()
+
+    async def _worker(self):
+        chat_limiter = TokenBucket(TELEGRAM_CHAT_RATE, capacity=1)
+        global_limiter = TokenBucket(TELEGRAM_GLOBAL_RATE)
+
+        async with httpx.AsyncClient(timeout=10) as client:
+            while True:
+                try:
+                    while await self._deliver(client, chat_limiter, global_limiter):
+                        pass
+                except Exception as e:
+                    print(f"Notification outbox error: {e}")
+
+                if self._stopping:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), TELEGRAM_OUTBOX_POLL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+
+dispatcher = NotificationDispatcher()
 
 
 def test_bot() -> dict:
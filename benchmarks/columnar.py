@@ -0,0 +1,118 @@
+"""
+Benchmark the columnar listing store against the previous dict pipeline.
+
+Usage: python -m benchmarks.columnar [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.services.columnar import ListingColumns
+
+FILTERS = {
+    "property_type": "apartment",
+    "min_price": 400,
+    "max_price": 900,
+    "max_distance": 25,
+}
+
+
+def synthetic_listings(count: int, seed: int = 0) -> list[dict]:
+    """Generate listings in the load_listings() format"""
+    rng = random.Random(seed)
+    base_date = datetime(2025, 1, 1)
+    return [
+        {
+            "web_slug": f"listing-{i}",
+            "property_type": rng.choice(["apartment", "house"]),
+            "price": float(rng.randint(300, 1500)),
+            "location": {
+                "latitude": 42.2 + rng.random() * 0.3,
+                "longitude": -8.7 + rng.random() * 0.3,
+            },
+            "type_attributes": {
+                "surface": float(rng.randint(40, 200)),
+                "rooms": rng.randint(1, 5),
+                "bathrooms": rng.randint(1, 3),
+            },
+            "modified_at": (base_date + timedelta(minutes=i)).isoformat(),
+            "distance_km": round(rng.random() * 40, 1),
+        }
+        for i in range(count)
+    ]
+
+
+def dict_filter(listings: list[dict]) -> list[dict]:
+    """Filtering as done before the columnar store (one pass per filter)"""
+    listings = [x for x in listings if x["property_type"] == FILTERS["property_type"]]
+    listings = [x for x in listings if x.get("price", 0) >= FILTERS["min_price"]]
+    listings = [x for x in listings if x.get("price", 0) <= FILTERS["max_price"]]
+    return [
+        x
+        for x in listings
+        if x.get("distance_km") is not None
+        and x["distance_km"] <= FILTERS["max_distance"]
+    ]
+
+
+def dict_stats(listings: list[dict]) -> dict:
+    """Stats as done before the columnar store (one pass per attribute)"""
+    attrs = [x["type_attributes"] for x in listings]
+    prices = [x["price"] for x in listings if x.get("price")]
+    rooms = [a["rooms"] for a in attrs if a.get("rooms")]
+    bathrooms = [a["bathrooms"] for a in attrs if a.get("bathrooms")]
+    distances = [x["distance_km"] for x in listings if x.get("distance_km")]
+    return {
+        "total": len(listings),
+        "apartments": len([x for x in listings if x["property_type"] == "apartment"]),
+        "houses": len([x for x in listings if x["property_type"] == "house"]),
+        "price": (min(prices), max(prices)),
+        "rooms": (min(rooms), max(rooms)),
+        "bathrooms": (min(bathrooms), max(bathrooms)),
+        "distance": (min(distances), max(distances)),
+    }
+
+
+def timed(func, repeat: int = 5) -> float:
+    """Best wall time of several runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'rows':>10} {'build ms':>10} {'dict filter':>12} {'mask filter':>12}"
+        f" {'dict stats':>11} {'array stats':>12}"
+    )
+    for size in args.sizes:
+        listings = synthetic_listings(size)
+        build = timed(lambda: ListingColumns(listings), repeat=1)
+        columns = ListingColumns(listings)
+
+        assert len(dict_filter(listings)) == len(
+            columns.select(columns.mask(**FILTERS))
+        )
+
+        print(
+            f"{size:>10} {build:>10.1f}"
+            f" {timed(lambda: dict_filter(listings)):>12.2f}"
+            f" {timed(lambda: columns.select(columns.mask(**FILTERS))):>12.2f}"
+            f" {timed(lambda: dict_stats(listings)):>11.2f}"
+            f" {timed(columns.stats):>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Local stand-ins for the Wallapop search API and the Telegram Bot API.
+
+Usage: python -m benchmarks.fake_api [--items 2000] [--page-size 40]
+       [--latency 0.05] [--error-rate 0.01] [--port 8900]
+
+Point the app at it with WALLAPOP_API_URL=http://127.0.0.1:8900 and
+TELEGRAM_API_URL=http://127.0.0.1:8900.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# 2025-01-01 in epoch milliseconds, as Wallapop sends dates
+BASE_MS = 1_735_689_600_000
+
+CITIES = [
+    ("Vigo", "36201", 42.2406, -8.7207),
+    ("Pontevedra", "36001", 42.4336, -8.6475),
+    ("Redondela", "36800", 42.2833, -8.6096),
+    ("Cangas", "36940", 42.2646, -8.7826),
+    ("Baiona", "36300", 42.1177, -8.8497),
+]
+FEATURES = [
+    "luminoso",
+    "reformado",
+    "con terraza",
+    "con garaje",
+    "amueblado",
+    "exterior",
+    "con vistas a la ría",
+    "cerca de la playa",
+]
+
+
+def free_port() -> int:
+    """A free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def encode_page(state: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def decode_page(token: str) -> dict:
+    return json.loads(base64.urlsafe_b64decode(token.encode()))
+
+
+class FakeApi:
+    """
+    Synthetic listings of each property type, served in pages with optional
+    latency and errors. Each version bump changes the price of one listing
+    in change_every, removes one in remove_every and adds new_fraction new
+    ones, like a market moving between refreshes.
+    """
+
+    def __init__(
+        self,
+        items: int = 2000,
+        page_size: int = 40,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        change_every: int = 10,
+        remove_every: int = 50,
+        new_fraction: float = 0.05,
+        seed: int = 0,
+    ):
+        self.items = items
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.change_every = change_every
+        self.remove_every = remove_every
+        self.new_fraction = new_fraction
+        self.version = 0
+        self.search_requests = 0
+        self.telegram_messages = []
+        self._generated = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def raw_item(self, property_type: str, index: int) -> dict:
+        """A listing as returned by the Wallapop search API"""
+        rng = random.Random(f"{property_type}-{index}")
+        city, postal_code, lat, lon = rng.choice(CITIES)
+        rooms = rng.randint(1, 5)
+        features = rng.sample(FEATURES, 3)
+        kind = "Piso" if property_type == "apartment" else "Casa"
+
+        price = rng.randrange(300, 1500, 10)
+        created_at = BASE_MS + index * 60_000
+        if index >= self.items:
+            # Added by a version bump, so newer than all the initial ones
+            created_at += 10**11
+        modified_at = created_at
+        if self.version and index % self.change_every == 0:
+            price += 10 * self.version
+            modified_at = BASE_MS + 10**11 * self.version + index
+
+        description = (
+            f"{kind} de {rooms} habitaciones en {city}, {', '.join(features)}. "
+            "Se piden referencias y un mes de fianza."
+        )
+        if index % 20 == 7:
+            description += " Alquiler de temporada, de septiembre a junio."
+
+        return {
+            "id": f"{property_type[0]}{index:08d}",
+            "user_id": f"user{index % 97}",
+            "category_id": 200,
+            "web_slug": f"{property_type}-{kind.lower()}-{index}",
+            "title": f"{kind} {features[0]} en {city}",
+            "description": description,
+            "price": {"amount": price, "currency": "EUR"},
+            "images": [
+                {
+                    "urls": {
+                        size: "https://cdn.wallapop.com/images/10420/"
+                        f"{property_type}{index}/{n}.jpg?pictureSize={size}"
+                        for size in ("small", "medium", "big")
+                    }
+                }
+                for n in range(rng.randint(1, 8))
+            ],
+            "reserved": {"flag": rng.random() < 0.05},
+            "location": {
+                "latitude": round(lat + rng.uniform(-0.05, 0.05), 6),
+                "longitude": round(lon + rng.uniform(-0.05, 0.05), 6),
+                "postal_code": postal_code,
+                "city": city,
+                "region": "Galicia",
+                "country_code": "ES",
+            },
+            "type_attributes": {
+                "operation": "rent",
+                "surface": rng.randint(40, 200),
+                "rooms": rooms,
+                "bathrooms": rng.randint(1, 3),
+            },
+            "created_at": created_at,
+            "modified_at": modified_at,
+            "shipping": {"item_is_shippable": False},
+            "bump": {"type": "none"},
+            "is_favoriteable": {"flag": True},
+            "is_refurbished": {"flag": False},
+            "is_top_profile": {"flag": False},
+            "has_warranty": {"flag": False},
+            "favorited": {"flag": False},
+            "taxonomy": [{"id": 200, "name": "Inmobiliaria"}],
+        }
+
+    def generated(self, property_type: str) -> list[dict]:
+        """Listings of a property type in the current version"""
+        key = (property_type, self.version)
+        if key not in self._generated:
+            count = self.items + int(self.items * self.new_fraction * self.version)
+            self._generated[key] = [
+                self.raw_item(property_type, index)
+                for index in range(count)
+                if not (self.version and index % self.remove_every == 1)
+            ]
+        return self._generated[key]
+
+    def listings(self, property_type: str, state: dict) -> list[dict]:
+        """Current listings matching a search, in its order"""
+        items = self.generated(property_type)
+        min_price = float(state.get("min_sale_price") or 0)
+        max_price = float(state.get("max_sale_price") or "inf")
+        items = [
+            item for item in items if min_price <= item["price"]["amount"] <= max_price
+        ]
+        if state.get("order_by") == "newest":
+            items.sort(key=lambda item: item["modified_at"], reverse=True)
+        else:
+            items.sort(key=lambda item: item["price"]["amount"])
+        return items
+
+    async def search(self, request: Request) -> JSONResponse:
+        with self._lock:
+            self.search_requests += 1
+            failed = self._rng.random() < self.error_rate
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if failed:
+            # Retry-After 0 keeps the scraper from backing off for seconds
+            status = 429 if self._rng.random() < 0.5 else 503
+            return JSONResponse({}, status_code=status, headers={"Retry-After": "0"})
+
+        params = dict(request.query_params)
+        if "next_page" in params:
+            state = decode_page(params["next_page"])
+        else:
+            state = {
+                "type": params.get("type", "apartment"),
+                "min_sale_price": params.get("min_sale_price"),
+                "max_sale_price": params.get("max_sale_price"),
+                "order_by": params.get("order_by"),
+                "offset": 0,
+            }
+
+        items = self.listings(state["type"], state)
+        offset = state["offset"]
+        page = items[offset : offset + self.page_size]
+        next_page = None
+        if offset + self.page_size < len(items):
+            next_page = encode_page({**state, "offset": offset + self.page_size})
+
+        return JSONResponse(
+            {
+                "data": {"section": {"payload": {"items": page}}},
+                "meta": {"next_page": next_page},
+            }
+        )
+
+    async def send_message(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        with self._lock:
+            self.telegram_messages.append(body)
+            message_id = len(self.telegram_messages)
+        return JSONResponse({"ok": True, "result": {"message_id": message_id}})
+
+    def app(self) -> FastAPI:
+        """ASGI app serving the fake APIs"""
+        app = FastAPI()
+        app.add_api_route("/api/v3/search", self.search, methods=["GET"])
+        app.add_api_route(
+            "/bot{token}/sendMessage", self.send_message, methods=["POST"]
+        )
+        app.add_api_route(
+            "/bot{token}/getMe",
+            lambda token: {"ok": True, "result": {"username": "fake_bot"}},
+            methods=["GET"],
+        )
+
+        @app.post("/_control/version/{version}")
+        def set_version(version: int):
+            self.version = version
+            return {"version": version}
+
+        return app
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    """Serve an ASGI app on a local port from a background thread"""
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+
+    fake = FakeApi(args.items, args.page_size, args.latency, args.error_rate)
+    uvicorn.run(fake.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Load test the read API with many concurrent clients.
+
+Start the server (e.g. uvicorn app.main:app --workers 1) on the code to
+compare, then run against it:
+
+Usage: python -m benchmarks.load [--url http://localhost:8000]
+       [--concurrency 50 100 200 500] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+# Requests spread over listings pages, searches and stats. Query strings vary
+# so the result cache doesn't answer everything.
+PATHS = [
+    "/api/listings?page={page}",
+    "/api/listings?sort_by=date&sort_order=desc&page={page}",
+    "/api/listings?max_price={price}&sort_by=distance",
+    "/api/listings?property_type=apartment&min_rooms=2&max_price={price}",
+    "/api/stats",
+    "/health",
+]
+
+
+def random_path(rng: random.Random) -> str:
+    return rng.choice(PATHS).format(
+        page=rng.randint(1, 20), price=rng.randrange(400, 1500, 10)
+    )
+
+
+async def client_loop(
+    client: httpx.AsyncClient, deadline: float, seed: int, latencies: list[float]
+) -> int:
+    """Send requests one after another until deadline, returning errors"""
+    rng = random.Random(seed)
+    errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(random_path(rng))
+            if response.status_code != 200:
+                errors += 1
+        except httpx.HTTPError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return errors
+
+
+async def run_level(url: str, concurrency: int, duration: float) -> dict:
+    """Requests per second and latencies with concurrency clients"""
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        errors = await asyncio.gather(
+            *[
+                client_loop(client, deadline, seed, latencies)
+                for seed in range(concurrency)
+            ]
+        )
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[50, 100, 200, 500]
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9}"
+        f" {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for concurrency in args.concurrency:
+        result = await run_level(args.url, concurrency, args.duration)
+        print(
+            f"{result['concurrency']:>8} {result['requests']:>9}"
+            f" {result['errors']:>7} {result['rps']:>9.1f}"
+            f" {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,301 @@
+"""
+Run the benchmark suite against local stand-ins and emit JSON results.
+
+The scraper talks to a fake Wallapop API and notifications go to a fake
+Telegram API (see benchmarks.fake_api). Listings are stored in the Postgres
+database of DATABASE_URL. Use a throwaway database: its listing tables are
+emptied.
+
+Usage: DATABASE_URL=postgresql://... python -m benchmarks.suite
+       [--items 1000] [--latency 0.02] [--error-rate 0.01]
+       [--seed-listings 20000] [--duration 5] [--output results.json]
+       [--baseline previous.json]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.fake_api import FakeApi, free_port, serve_in_thread
+from benchmarks.load import run_level
+
+FILTERS = {
+    "property_type": "apartment",
+    "min_price": 400,
+    "max_price": 900,
+    "min_rooms": 2,
+    "max_distance": 25,
+}
+
+
+def configure(args, fake_url: str):
+    """Point the app at the stand-ins (before any app module is imported)"""
+    os.environ["WALLAPOP_API_URL"] = fake_url
+    os.environ["TELEGRAM_API_URL"] = fake_url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "benchmark"
+    os.environ["TELEGRAM_CHAT_ID"] = "benchmark"
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    os.environ["SCRAPER_RATE"] = str(args.rate)
+
+
+def git_commit() -> dict:
+    """Commit of the working tree and whether it has local changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def timed(func) -> tuple[float, object]:
+    """Wall time of one call, in seconds, and its result"""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def reset_database():
+    from sqlalchemy import text
+
+    from app.db import engine, init_db
+    from app.services.cache import bump_version
+
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "TRUNCATE listings, listing_search, listing_history, "
+                "notification_outbox"
+            )
+        )
+    bump_version()
+
+
+def bench_refresh(fake: FakeApi) -> dict:
+    """Full sweep, incremental refresh after the market moved, no-op sweep"""
+    from app.services.scraper import refresh_all_listings
+
+    results = {}
+    for name, version, full in [
+        ("refresh_full", 0, True),
+        ("refresh_incremental", 1, False),
+        ("refresh_full_unchanged", 1, True),
+    ]:
+        fake.version = version
+        requests_before = fake.search_requests
+        seconds, result = timed(lambda: refresh_all_listings(full=full))
+        results[name] = {
+            "seconds": seconds,
+            "search_requests": fake.search_requests - requests_before,
+            "new": sum(r["new"] for r in result["results"]),
+            "updated": sum(r["updated"] for r in result["results"]),
+            "removed": sum(r["removed"] for r in result["results"]),
+        }
+    return results
+
+
+def bench_sync(fake: FakeApi, count: int, batch_size: int) -> dict:
+    """Upserts of new, unchanged and changed listings, then a removal"""
+    from app.db import SessionLocal
+    from app.services.scraper import prepare_items
+    from app.services.sync import publish_changes, remove_missing, upsert_listings
+
+    def raw_items(version: int) -> list[dict]:
+        fake.version = version
+        # Indexes past the scraped ones, so these are new listings
+        start = fake.items * 10
+        return [fake.raw_item("apartment", start + index) for index in range(count)]
+
+    def upsert_all(items: list[dict]) -> dict:
+        db = SessionLocal()
+        try:
+            totals = {"new": 0, "updated": 0}
+            for start in range(0, len(items), batch_size):
+                changes = upsert_listings(
+                    db, "apartment", items[start : start + batch_size]
+                )
+                totals["new"] += len(changes["new"])
+                totals["updated"] += len(changes["updated"])
+            publish_changes(db)
+            return totals
+        finally:
+            db.close()
+
+    results = {}
+    for name, version in [
+        ("sync_insert", 0),
+        ("sync_unchanged", 0),
+        ("sync_changed", 1),
+    ]:
+        items, _, _ = prepare_items(raw_items(version))
+        seconds, totals = timed(lambda: upsert_all(items))
+        results[name] = {"seconds": seconds, "listings": len(items), **totals}
+
+    db = SessionLocal()
+    try:
+        keep = {item["web_slug"] for item in items[: len(items) // 2]}
+        seconds, removed = timed(lambda: remove_missing(db, "apartment", keep))
+        publish_changes(db)
+    finally:
+        db.close()
+    results["sync_remove"] = {"seconds": seconds, "removed": len(removed)}
+    return results
+
+
+def bench_load_filter() -> dict:
+    """
+    Loading all listings and their columns (cold), and filtering and sorting
+    them in memory
+    """
+    from app.services.cache import bump_version
+    from app.services.listings import (
+        filter_listings,
+        load_columns,
+        load_listings,
+        sort_listings,
+    )
+
+    bump_version()
+    load_seconds, listings = timed(load_listings)
+    columns_seconds, _ = timed(load_columns)
+    filter_seconds, filtered = timed(lambda: filter_listings(**FILTERS))
+    sort_seconds, _ = timed(lambda: sort_listings(filtered, "price", "asc"))
+    return {
+        "load_listings": {"seconds": load_seconds, "listings": len(listings)},
+        "load_columns": {"seconds": columns_seconds},
+        "filter_listings": {"seconds": filter_seconds, "matches": len(filtered)},
+        "sort_listings": {"seconds": sort_seconds},
+    }
+
+
+def bench_api(duration: float, concurrency: list[int]) -> dict:
+    """/api/listings end to end: one cold request, then concurrent clients"""
+    from app.main import app
+    from app.services.cache import bump_version
+
+    port = free_port()
+    server = serve_in_thread(app, port)
+    url = f"http://127.0.0.1:{port}"
+    results = {}
+    try:
+        bump_version()
+        seconds, response = timed(
+            lambda: httpx.get(f"{url}/api/listings", params={"page_size": 20})
+        )
+        results["api_cold"] = {"seconds": seconds, "status": response.status_code}
+
+        for clients in concurrency:
+            level = asyncio.run(run_level(url, clients, duration))
+            results[f"api_{clients}_clients"] = {
+                "rps": level["rps"],
+                "p50_ms": level["p50_ms"],
+                "p99_ms": level["p99_ms"],
+                "requests": level["requests"],
+                "errors": level["errors"],
+            }
+    finally:
+        server.should_exit = True
+    return results
+
+
+def compare(results: dict, baseline: dict):
+    """Print timings and throughput relative to a previous run"""
+    print(
+        f"{'benchmark':<28} {'metric':<8} {'baseline':>10} {'now':>10} {'change':>8}",
+        file=sys.stderr,
+    )
+    for name, values in results["results"].items():
+        previous = baseline.get("results", {}).get(name, {})
+        for metric in ("seconds", "rps", "p99_ms"):
+            if metric not in values or not previous.get(metric):
+                continue
+            change = values[metric] / previous[metric] - 1
+            print(
+                f"{name:<28} {metric:<8} {previous[metric]:>10.3f}"
+                f" {values[metric]:>10.3f} {change:>+8.1%}",
+                file=sys.stderr,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--rate", type=float, default=100)
+    parser.add_argument("--seed-listings", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("DATABASE_URL must point to a throwaway Postgres database")
+
+    # The scraper reads at most 10 pages per search
+    fake = FakeApi(
+        items=args.items,
+        page_size=math.ceil(args.items / 10),
+        latency=args.latency,
+        error_rate=args.error_rate,
+    )
+    port = free_port()
+    fake_server = serve_in_thread(fake.app(), port)
+    configure(args, f"http://127.0.0.1:{port}")
+
+    try:
+        reset_database()
+        results = {}
+        results.update(bench_refresh(fake))
+        results.update(bench_sync(fake, args.seed_listings, args.batch_size))
+        results.update(bench_load_filter())
+        results.update(bench_api(args.duration, args.concurrency))
+        results["telegram"] = {"messages": len(fake.telegram_messages)}
+    finally:
+        from app.services.telegram import dispatcher
+
+        dispatcher.stop()
+        fake_server.should_exit = True
+
+    report = {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
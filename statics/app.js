@@ -1,6 +1,7 @@
 let allListings = [];
 let currentPage = 1;
 let totalPages = 1;
+let nextCursor = null;
 const PAGE_SIZE = 20;
 
 // Initialize
@@ -34,17 +35,20 @@ function setupEventListeners() {
   });
 }
 
-async function loadListings(page = 1) {
+async function loadListings(page = 1, cursor = null) {
   currentPage = page;
   const params = buildFilterParams();
   params.set("page", page);
   params.set("page_size", PAGE_SIZE);
+  params.set("fields", "summary");
+  if (cursor) params.set("cursor", cursor);
 
   try {
     const response = await fetch("/api/listings?" + params.toString());
     const data = await response.json();
     allListings = data.listings;
     totalPages = data.pages;
+    nextCursor = data.next_cursor;
     renderListings(data.listings);
     updateStats(data.total);
     renderPagination();
@@ -61,6 +65,7 @@ async function loadListings(page = 1) {
 function buildFilterParams() {
   const params = new URLSearchParams();
 
+  const q = document.getElementById("filter-q").value.trim();
   const type = document.getElementById("filter-type").value;
   const minPrice = document.getElementById("filter-min-price").value;
   const maxPrice = document.getElementById("filter-max-price").value;
@@ -73,6 +78,7 @@ function buildFilterParams() {
     .getElementById("filter-sort")
     .value.split("-");
 
+  if (q) params.set("q", q);
   if (type) params.set("property_type", type);
   if (minPrice) params.set("min_price", minPrice);
   if (maxPrice) params.set("max_price", maxPrice);
@@ -104,9 +110,10 @@ function renderListings(listings) {
 }
 
 function createCard(listing, index) {
-  const images = listing.images || [];
+  const imageCount = listing.image_count || 0;
   const firstImage =
-    images[0] || "https://via.placeholder.com/400x300?text=Sin+imagen";
+    listing.thumbnail ||
+    "https://via.placeholder.com/400x300?text=Sin+imagen";
   const typeLabel = listing.property_type === "apartment" ? "Piso" : "Casa";
   const typeColor =
     listing.property_type === "apartment"
@@ -130,10 +137,10 @@ function createCard(listing, index) {
                     ${typeLabel}
                 </span>
                 ${
-                  images.length > 1
+                  imageCount > 1
                     ? `
                     <span class="absolute top-2 right-2 bg-black/60 text-white text-xs px-2 py-1 rounded">
-                        ${images.length}
+                        ${imageCount}
                     </span>
                 `
                     : ""
@@ -150,6 +157,11 @@ function createCard(listing, index) {
                     ${surface ? `<span>${surface}m2</span>` : ""}
                     ${listing.distance_km ? `<span>${listing.distance_km}km</span>` : ""}
                 </div>
+                ${
+                  listing.headline
+                    ? `<p class="headline text-sm text-gray-500 mt-2 line-clamp-2">${highlight(listing.headline)}</p>`
+                    : ""
+                }
             </div>
         </div>
     `;
@@ -218,7 +230,12 @@ function renderPagination() {
 
 function goToPage(page) {
   if (page < 1 || page > totalPages) return;
-  loadListings(page);
+  // Moving forward one page continues from the cursor instead of an offset
+  if (page === currentPage + 1 && nextCursor) {
+    loadListings(page, nextCursor);
+  } else {
+    loadListings(page);
+  }
   window.scrollTo({ top: 0, behavior: "smooth" });
 }
 
@@ -232,6 +249,7 @@ function applyFilters() {
 }
 
 function clearFilters() {
+  document.getElementById("filter-q").value = "";
   document.getElementById("filter-type").value = "";
   document.getElementById("filter-min-price").value = "";
   document.getElementById("filter-max-price").value = "";
@@ -247,7 +265,38 @@ function clearFilters() {
 
 function openModal(index) {
   const listing = allListings[index];
-  const images = listing.images || [];
+  renderModal(listing, index);
+
+  const modal = document.getElementById("modal");
+  modal.classList.remove("hidden");
+  modal.classList.add("flex");
+  document.body.style.overflow = "hidden";
+
+  loadListingDetail(listing, index);
+}
+
+// Lists only carry a summary, so the full listing is fetched on opening
+async function loadListingDetail(listing, index) {
+  try {
+    const response = await fetch(
+      `/api/listings/${encodeURIComponent(listing.web_slug)}`,
+    );
+    if (!response.ok) return;
+    const detail = await response.json();
+    // Skip if another listing was opened meanwhile
+    const content = document.getElementById("modal-content");
+    if (content.dataset.slug === listing.web_slug) {
+      // Distances in lists may be measured from the searched point
+      renderModal({ ...detail, distance_km: listing.distance_km }, index);
+    }
+  } catch (err) {
+    console.error("Error loading listing:", err);
+  }
+}
+
+function renderModal(listing, index) {
+  const images =
+    listing.images || (listing.thumbnail ? [listing.thumbnail] : []);
   const typeLabel = listing.property_type === "apartment" ? "Piso" : "Casa";
   const typeColor =
     listing.property_type === "apartment"
@@ -260,46 +309,11 @@ function openModal(index) {
 
   const carouselId = `carousel-${index}`;
 
-  document.getElementById("modal-content").innerHTML = `
+  const content = document.getElementById("modal-content");
+  content.dataset.slug = listing.web_slug;
+  content.innerHTML = `
         <div class="relative">
-            <!-- Carousel -->
-            <div class="image-carousel flex overflow-x-auto" id="${carouselId}">
-                ${
-                  images.length > 0
-                    ? images
-                        .map(
-                          (img, i) => `
-                    <img src="${escapeHtml(img)}"
-                         alt="Imagen ${i + 1}"
-                         class="w-full h-64 md:h-96 object-cover flex-shrink-0"
-                         onerror="this.src='https://via.placeholder.com/800x400?text=Error'">
-                `,
-                        )
-                        .join("")
-                    : `
-                    <div class="w-full h-64 md:h-96 bg-gray-200 flex items-center justify-center text-gray-500">
-                        Sin imagenes
-                    </div>
-                `
-                }
-            </div>
-            ${
-              images.length > 1
-                ? `
-                <button onclick="scrollCarousel('${carouselId}', -1)"
-                        class="absolute left-2 top-1/2 -translate-y-1/2 bg-white/90 rounded-full p-2 shadow hover:bg-white text-xl">
-                    <-
-                </button>
-                <button onclick="scrollCarousel('${carouselId}', 1)"
-                        class="absolute right-2 top-1/2 -translate-y-1/2 bg-white/90 rounded-full p-2 shadow hover:bg-white text-xl">
-                    ->
-                </button>
-                <div class="absolute bottom-2 left-1/2 -translate-x-1/2 bg-black/60 text-white text-sm px-3 py-1 rounded-full">
-                    ${images.length} fotos
-                </div>
-            `
-                : ""
-            }
+            ${carouselHtml(carouselId, images)}
             <button onclick="closeModal()"
                     class="absolute top-2 right-2 bg-white/90 rounded-full w-10 h-10 shadow hover:bg-white text-xl flex items-center justify-center">
                 X
@@ -394,11 +408,49 @@ function openModal(index) {
             </a>
         </div>
     `;
+}
 
-  const modal = document.getElementById("modal");
-  modal.classList.remove("hidden");
-  modal.classList.add("flex");
-  document.body.style.overflow = "hidden";
+function carouselHtml(carouselId, images) {
+  return `
+            <!-- Carousel -->
+            <div class="image-carousel flex overflow-x-auto" id="${carouselId}">
+                ${
+                  images.length > 0
+                    ? images
+                        .map(
+                          (img, i) => `
+                    <img src="${escapeHtml(img)}"
+                         alt="Imagen ${i + 1}"
+                         class="w-full h-64 md:h-96 object-cover flex-shrink-0"
+                         onerror="this.src='https://via.placeholder.com/800x400?text=Error'">
+                `,
+                        )
+                        .join("")
+                    : `
+                    <div class="w-full h-64 md:h-96 bg-gray-200 flex items-center justify-center text-gray-500">
+                        Sin imagenes
+                    </div>
+                `
+                }
+            </div>
+            ${
+              images.length > 1
+                ? `
+                <button onclick="scrollCarousel('${carouselId}', -1)"
+                        class="absolute left-2 top-1/2 -translate-y-1/2 bg-white/90 rounded-full p-2 shadow hover:bg-white text-xl">
+                    <-
+                </button>
+                <button onclick="scrollCarousel('${carouselId}', 1)"
+                        class="absolute right-2 top-1/2 -translate-y-1/2 bg-white/90 rounded-full p-2 shadow hover:bg-white text-xl">
+                    ->
+                </button>
+                <div class="absolute bottom-2 left-1/2 -translate-x-1/2 bg-black/60 text-white text-sm px-3 py-1 rounded-full">
+                    ${images.length} fotos
+                </div>
+            `
+                : ""
+            }
+  `;
 }
 
 function closeModal() {
@@ -417,6 +469,13 @@ function scrollCarousel(id, direction) {
 }
 
 // Utility: escape HTML to prevent XSS
+// Search headlines mark matches with <mark>; everything else is escaped
+function highlight(headline) {
+  return escapeHtml(headline)
+    .replaceAll("&lt;mark&gt;", "<mark>")
+    .replaceAll("&lt;/mark&gt;", "</mark>");
+}
+
 function escapeHtml(text) {
   if (!text) return "";
   const div = document.createElement("div");